@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+Benchmark of the stages of the reference resolution pipeline on a synthetic
+workbook (see `generate.py`).
+
+The best time of each stage is stored as JSON together with the commit and
+the environment, so that the results of two commits on the same machine can
+be compared.
+
+Usage::
+
+    $ python benchmarks/bench_pipeline.py -o new.json --rows 10000
+    $ python benchmarks/bench_pipeline.py -o new.json --compare old.json
+"""
+import os
+import sys
+import json
+import timeit
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import os.path as osp
+
+# Benchmark the working tree, also when run as a script or a module.
+_dir = osp.dirname(osp.abspath(__file__))
+sys.path[:0] = [_dir, osp.dirname(_dir)]
+
+from xlref.parser import Ref  # noqa: E402
+from xlref.engines import LazySheet  # noqa: E402
+from xlref.errors import NoFullCell  # noqa: E402
+from xlref.process import save_json  # noqa: E402
+from generate import generate, PATTERNS  # noqa: E402
+
+MOVES = 'L', 'U', 'R', 'D', 'LD', 'LU', 'UL', 'UR', 'RU', 'RD', 'DL', 'DR'
+
+
+def _time(func, setup=tuple, number=1, repeat=3):
+    # Best time of `func(*setup())`, excluding `setup`.
+    res = []
+    for _ in range(repeat):
+        args = setup()
+        res.append(timeit.timeit(lambda: func(*args), number=number) / number)
+    return min(res)
+
+
+def _sheet(fpath, name='s0'):
+    ref = Ref('%s#%s!A1' % (fpath, name))
+    ref.lazy_sheet.values  # Exclude the sheet parsing from timings.
+    return ref
+
+
+def _fresh(ref):
+    # Reference on a copy of the sheet without derived structures.
+    new = Ref('#A1')
+    new.ref['xl_sheet'] = LazySheet(values=ref.lazy_sheet.columns)
+    return new,
+
+
+def _target_full(ref, moves):
+    rows, cols = ref.full_cells.shape
+    cell = (rows // 2, cols // 2) if 'U' in moves or 'L' in moves else (0, 0)
+    try:
+        ref._target_full(cell, moves)
+    except NoFullCell:
+        pass
+
+
+def bench(fpath, number=1, repeat=3):
+    """
+    Time the stages of the reference resolution pipeline.
+
+    :param fpath:
+        Workbook file path (see `generate.py`).
+    :type fpath: str
+
+    :param number:
+        Number of executions of each timing.
+    :type number: int
+
+    :param repeat:
+        Number of timings (the best is returned).
+    :type repeat: int
+
+    :return:
+        Best time of each stage, in seconds.
+    :rtype: dict[str, float]
+    """
+    t, res = lambda *a, **k: _time(*a, number=number, repeat=repeat, **k), {}
+    res['open_workbook'] = t(
+        lambda: Ref('%s#A1' % fpath)._open_workbook(fpath).sheet_names
+    )
+    res['open_sheet'] = t(
+        lambda r, wb: r._open_sheet(wb, 's0').values,
+        lambda: (Ref('#A1'), Ref('%s#A1' % fpath)._open_workbook(fpath))
+    )
+    ref = _sheet(fpath)
+    res['full_cells'] = t(lambda r: r.full_cells, lambda: _fresh(ref))
+    res['margins'] = t(lambda r: r.margins, lambda: _fresh(ref))
+    res['target_full_index'] = t(
+        lambda r: _target_full(r, 'D'), lambda: _fresh(ref)
+    )
+    _target_full(ref, 'D')  # Build the index once.
+    for moves in MOVES:
+        res['target_full_%s' % moves] = t(_target_full, lambda: (ref, moves))
+    rows, cols = ref.full_cells.shape
+    st, nd = (rows // 2, cols // 2), (rows // 2, cols // 2)
+    res['expand_range_sat'] = t(
+        lambda r: r._expand_range(st, nd, 'LURD'), lambda: _fresh(ref)
+    )
+    ref._expand_range(st, nd, 'LURD')  # Build the summed area table once.
+    for exp in ('LURD', 'RD', 'UL'):
+        res['expand_range_%s' % exp] = t(
+            lambda: ref._expand_range(st, nd, exp)
+        )
+    filters = {
+        'recursive': '%s#refs!B1:B_["recursive"]',
+        'dict': '%s#refs!A1:B_["dict"]',
+        'dict_recursive': '%s#refs!A1:B_["recursive", "dict"]',
+        'full': '%s#s0!A1:__["full"]'
+    }
+    for k, r in filters.items():
+        cache = ref.cache
+        res['filter_%s' % k] = t(
+            lambda: Ref(r % fpath, cache=cache).values
+        )
+    data = [ref.sheet, Ref('%s#refs!A1:B_["dict"]' % fpath).values]
+    with tempfile.TemporaryDirectory() as d:
+        res['save_json'] = t(save_json, lambda: (osp.join(d, 'o.json'), data))
+    return res
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=osp.dirname(osp.abspath(
+                __file__
+            )), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(new, old):
+    """
+    Print the ratio between the stage times of two results.
+
+    :param new:
+        New results.
+    :type new: dict
+
+    :param old:
+        Old results.
+    :type old: dict
+    """
+    print('%-24s %12s %12s %8s' % ('stage', 'old [s]', 'new [s]', 'ratio'))
+    for k, v in new['results'].items():
+        o = old['results'].get(k)
+        if o is not None:
+            print('%-24s %12.6f %12.6f %8.2f' % (k, o, v, v / o))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-o', '--output', help='JSON results file path.')
+    parser.add_argument('--compare', help='JSON results to compare with.')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--cols', type=int, default=20)
+    parser.add_argument('--density', type=float, default=.5)
+    parser.add_argument('--pattern', choices=PATTERNS, default='random')
+    parser.add_argument('--sheets', type=int, default=1)
+    parser.add_argument('--refs', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+    params = {k: getattr(args, k) for k in (
+        'rows', 'cols', 'density', 'pattern', 'sheets', 'refs'
+    )}
+    with tempfile.TemporaryDirectory() as d:
+        fpath = generate(osp.join(d, 'bench.xlsx'), **params)
+        results = bench(fpath, repeat=args.repeat)
+    res = {
+        'commit': _commit(), 'python': platform.python_version(),
+        'numpy': np.__version__, 'platform': platform.platform(),
+        'cpus': os.cpu_count(), 'params': params, 'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(res, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get('params') != params:
+            print('Warning: different parameters %s.' % old.get('params'),
+                  file=sys.stderr)
+        compare(res, old)
+    else:
+        for k, v in results.items():
+            print('%-24s %12.6f' % (k, v))
+
+
+if __name__ == '__main__':
+    main()
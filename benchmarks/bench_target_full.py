@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+Benchmark of the `Ref._target_full` search: cell by cell scan (old) vs index
+of the full cells (new).
+
+Usage::
+
+    $ python benchmarks/bench_target_full.py [rows] [cols] [density]
+"""
+import sys
+import timeit
+import numpy as np
+from xlref.parser import Ref, _primitive_dir
+from xlref.engines import LazySheet
+from xlref.errors import NoFullCell
+
+MOVES = 'L', 'U', 'R', 'D', 'LD', 'LU', 'UL', 'UR', 'RU', 'RD', 'DL', 'DR'
+
+
+def scan(ref, cell, moves):
+    """Old implementation of `Ref._target_full`."""
+    up, dn = (0, 0), (ref.margins[0]['_'], ref.margins[1]['_'])
+    mv = _primitive_dir[moves[0]]
+    c0, full_cells = np.array(cell), ref.full_cells
+    if 'U' in moves and not c0[0] <= dn[0]:
+        c0[0] = dn[0]
+    if 'L' in moves and not c0[1] <= dn[1]:
+        c0[1] = dn[1]
+    while (up <= c0).all() and (c0 <= dn).all():
+        c1 = c0.copy()
+        while (up <= c1).all():
+            try:
+                if full_cells[c1[0], c1[1]]:
+                    return c1
+            except IndexError:
+                break
+            c1 += mv
+        try:
+            c0 += _primitive_dir[moves[1]]
+        except IndexError:
+            break
+    raise NoFullCell(cell, moves)
+
+
+def sparse_ref(rows, cols, density, seed=0):
+    rnd = np.random.RandomState(seed)
+    grid = np.full((rows, cols), np.nan, object)
+    grid[rnd.rand(rows, cols) < density] = 1.0
+    grid[-1, -1] = 1.0
+    ref = Ref('#A1')
+    ref.ref['xl_sheet'] = LazySheet(values=grid)
+    ref.full_cells, ref.margins  # Exclude the sheet derivation from timings.
+    return ref
+
+
+def _time(func, *args, number=3):
+    def run():
+        try:
+            func(*args)
+        except NoFullCell:
+            pass
+
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main(rows=50000, cols=20, density=1e-4):
+    ref = sparse_ref(rows, cols, density)
+    _time(ref._target_full, (0, 0), 'D', number=1)  # Build the index once.
+    print('%-4s %12s %12s %10s' % ('move', 'old [s]', 'new [s]', 'speedup'))
+    for moves in MOVES:
+        cell = (rows // 2, cols // 2) if 'U' in moves or 'L' in moves else (
+            0, 0)
+        old = _time(scan, ref, cell, moves)
+        new = _time(ref._target_full, cell, moves)
+        print('%-4s %12.6f %12.6f %10.1f' % (moves, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main(*(t(v) for t, v in zip((int, int, float), sys.argv[1:])))
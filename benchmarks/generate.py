@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+Synthetic workbook generator for the benchmarks.
+
+Each data sheet (`S0`, `S1`, ...) holds numbers, strings and dates placed
+according to a sparsity pattern, while the `refs` sheet holds a key column
+and a column of references to the cells of `S0` (for the `recursive` and
+`dict` filters).
+
+Usage::
+
+    $ python benchmarks/generate.py out.xlsx [rows] [cols] [density] \
+        [pattern] [sheets]
+"""
+import sys
+import datetime
+import numpy as np
+
+#: Sparsity patterns of the full cells.
+PATTERNS = 'random', 'blocks', 'rows', 'diagonal'
+
+
+def mask(rows, cols, density, pattern='random', seed=0):
+    """
+    Return the full cells of a synthetic sheet.
+
+    :param rows:
+        Number of rows.
+    :type rows: int
+
+    :param cols:
+        Number of columns.
+    :type cols: int
+
+    :param density:
+        Approximate fraction of full cells.
+    :type density: float
+
+    :param pattern:
+        Sparsity pattern (see `PATTERNS`).
+    :type pattern: str
+
+    :param seed:
+        Random seed.
+    :type seed: int
+
+    :return:
+        Full cells.
+    :rtype: numpy.ndarray
+    """
+    rnd, full = np.random.RandomState(seed), np.zeros((rows, cols), bool)
+    if pattern == 'random':
+        full[rnd.rand(rows, cols) < density] = True
+    elif pattern == 'blocks':  # Tables separated by empty rows and columns.
+        h, w = max(rows // 10, 1), max(cols // 4, 1)
+        for r in range(0, rows, h + 2):
+            for c in range(0, cols, w + 1):
+                if rnd.rand() < density:
+                    full[r:r + h, c:c + w] = True
+    elif pattern == 'rows':
+        full[rnd.rand(rows) < density, :] = True
+    elif pattern == 'diagonal':
+        i = np.arange(rows)
+        for k in range(max(int(density * cols), 1)):
+            full[i, (i + k) % cols] = True
+    else:
+        raise ValueError('Invalid pattern %r.' % pattern)
+    full[0, 0] = full[-1, -1] = True
+    return full
+
+
+def grid(full, seed=0):
+    """
+    Return the values of a synthetic sheet.
+
+    :param full:
+        Full cells.
+    :type full: numpy.ndarray
+
+    :param seed:
+        Random seed.
+    :type seed: int
+
+    :return:
+        Sheet values (empty cells are `None`).
+    :rtype: numpy.ndarray
+    """
+    rnd = np.random.RandomState(seed)
+    values = np.full(full.shape, None, object)
+    kind = rnd.randint(0, 10, full.shape[1])  # Column types.
+    for c in range(full.shape[1]):
+        rows = np.flatnonzero(full[:, c])
+        if kind[c] == 0:
+            v = ['s%d' % i for i in rnd.randint(0, 1000, rows.size)]
+        elif kind[c] == 1:
+            d = datetime.datetime(2020, 1, 1)
+            v = [d + datetime.timedelta(days=int(i))
+                 for i in rnd.randint(0, 3650, rows.size)]
+        else:
+            v = rnd.rand(rows.size).tolist()
+        values[rows, c] = v
+    return values
+
+
+def generate(fpath, rows=1000, cols=20, density=.5, pattern='random',
+             sheets=1, refs=100, seed=0):
+    """
+    Write a synthetic workbook.
+
+    :param fpath:
+        Output file path (`.xlsx`).
+    :type fpath: str
+
+    :param rows:
+        Number of rows of the data sheets.
+    :type rows: int
+
+    :param cols:
+        Number of columns of the data sheets.
+    :type cols: int
+
+    :param density:
+        Approximate fraction of full cells.
+    :type density: float
+
+    :param pattern:
+        Sparsity pattern (see `PATTERNS`).
+    :type pattern: str
+
+    :param sheets:
+        Number of data sheets.
+    :type sheets: int
+
+    :param refs:
+        Number of references of the `refs` sheet.
+    :type refs: int
+
+    :param seed:
+        Random seed.
+    :type seed: int
+
+    :return:
+        Output file path.
+    :rtype: str
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    wb = Workbook(write_only=True)
+    for i in range(sheets):
+        ws = wb.create_sheet('S%d' % i)
+        full = mask(rows, cols, density, pattern, seed + i)
+        for row in grid(full, seed + i):
+            ws.append(row.tolist())
+    ws = wb.create_sheet('refs')
+    rnd = np.random.RandomState(seed)
+    for i, (r, c) in enumerate(zip(rnd.randint(1, rows + 1, refs),
+                                   rnd.randint(1, cols + 1, refs))):
+        ws.append(['k%d' % i, '#S0!%s%d' % (get_column_letter(c), r)])
+    wb.save(fpath)
+    return fpath
+
+
+if __name__ == '__main__':
+    types = str, int, int, float, str, int
+    generate(*(t(v) for t, v in zip(types, sys.argv[1:])))
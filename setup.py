@@ -83,7 +83,7 @@ if __name__ == '__main__':
         'wheel', 'sphinx>=7.2', 'gitchangelog', 'mako', 'sphinx_rtd_theme',
         'setuptools>=36.0.1', 'sphinxcontrib-restbuilder', 'coveralls', 'ddt',
         'twine', 'sphinx-click'
-    ]}
+    ], 'arrow': ['pyarrow']}
     setup(
         name=name,
         version=proj_ver,
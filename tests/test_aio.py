@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+import asyncio
+import unittest
+import os.path as osp
+
+files_dir = osp.join(osp.dirname(__file__), 'files')
+xl_file = osp.join(files_dir, 'excel.xlsx')
+csv_file = osp.join(files_dir, 'test.csv')
+
+
+class TestAio(unittest.TestCase):
+    def test_read_many(self):
+        from xlref.aio import read_many
+        from xlref.parser import Ref
+        refs = [
+            '%s#ref!E2:G3' % xl_file, '%s#A1:C2' % csv_file,
+            '%s#ref!A1(RD):RD' % xl_file, '%s#origin!A1' % xl_file
+        ]
+        values = asyncio.run(read_many(refs))
+        self.assertEqual(str(values), str([Ref(r).values for r in refs]))
+
+    def test_opener(self):
+        from xlref.aio import read, read_many
+        from xlref.cache import SheetCache
+        from xlref.errors import InvalidReference
+        calls = []
+
+        async def opener(fpath):
+            calls.append(fpath)
+            await asyncio.sleep(0)
+            with open(fpath, 'rb') as f:
+                return f.read()
+
+        cache = SheetCache()
+        refs = ['%s#ref!E%d' % (xl_file, i) for i in range(2, 5)]
+        values = asyncio.run(read_many(refs, cache, opener=opener))
+        self.assertEqual([v.tolist() for v in values], [
+            [[1.0]], [[4.0]], [[7.0]]
+        ])
+        self.assertEqual(calls, [xl_file])
+        with self.assertRaises(InvalidReference):
+            asyncio.run(read('#A1', cache))
+
+    def test_evicted(self):
+        from xlref.aio import read
+        from xlref.cache import SheetCache
+        calls = []
+
+        async def opener(fpath):
+            calls.append(fpath)
+            with open(fpath, 'rb') as f:
+                return f.read()
+
+        cache, ref = SheetCache(), '%s#ref!E2' % xl_file
+        self.assertEqual(asyncio.run(read(ref, cache, opener=opener)), 1)
+        cache.clear()  # A new loop re-opens the evicted book with `opener`.
+        self.assertEqual(asyncio.run(read(ref, cache, opener=opener)), 1)
+        self.assertEqual(calls, [xl_file] * 2)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+import os
+import shutil
+import tempfile
+import unittest
+import os.path as osp
+from unittest import mock
+
+test_dir = osp.dirname(__file__)
+xl_file = osp.join(test_dir, 'files', 'excel.xlsx')
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.fpath = osp.join(self.temp, 'excel.xlsx')
+        shutil.copy(xl_file, self.fpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp, ignore_errors=True)
+
+    def read(self, store, ref='#ref!A1(RD):RD["dict"]'):
+        from xlref.parser import Ref
+        return Ref(self.fpath + ref, store=store).values
+
+    def test_warm_read(self):
+        from xlref.cache import DiskCache
+        from xlref.engines import OpenpyxlBook
+        store = DiskCache(osp.join(self.temp, 'cache'))
+        res = self.read(store), self.read(store, '#^^')
+        self.assertEqual(len(store.entries()), 1)
+        with mock.patch.object(OpenpyxlBook, '_load', side_effect=IOError):
+            self.assertEqual(str(self.read(store)), str(res[0]))
+            self.assertEqual(self.read(store, '#^^').tolist(), res[1].tolist())
+
+    def test_strings(self):
+        from xlref.parser import Ref
+        from xlref.cache import DiskCache
+        from xlref.engines import ENGINES, XlsxBook, StringBlock
+
+        class MyRef(Ref):
+            _engines = dict(ENGINES, xlsx=XlsxBook)
+
+        store, ref = DiskCache(osp.join(self.temp, 'cache')), '#ref!A1:G5'
+        res = MyRef(self.fpath + ref, store=store).values
+        with mock.patch.object(XlsxBook, 'sheet', side_effect=IOError):
+            book = MyRef(self.fpath + ref, store=store).book
+            blocks = book.sheet('ref').columns.blocks
+            strings = [b for _, _, b in blocks if isinstance(b, StringBlock)]
+            self.assertTrue(strings)
+            self.assertEqual(strings[0].table.decoded, 0)
+            values = MyRef(self.fpath + ref, store=store).values
+        self.assertEqual(str(values.tolist()), str(res.tolist()))
+
+    def test_invalidation(self):
+        from xlref.cache import DiskCache
+        store = DiskCache(osp.join(self.temp, 'cache'))
+        self.read(store)
+        key = store.entries()[0]
+        st = os.stat(self.fpath)
+        os.utime(self.fpath, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.read(store)
+        self.assertEqual(len(store.entries()), 1)
+        self.assertNotEqual(store.entries()[0], key)
+
+    def test_eviction(self):
+        from xlref.cache import DiskCache
+        store = DiskCache(osp.join(self.temp, 'cache'), max_bytes=1)
+        other = osp.join(self.temp, 'other.xlsx')
+        shutil.copy(xl_file, other)
+        self.read(store)
+        key = store.entries()[0]
+        from xlref.parser import Ref
+        Ref(other + '#ref!A1', store=store).values
+        self.assertEqual(len(store.entries()), 1)
+        self.assertNotEqual(store.entries()[0], key)
+
+
+class TestSheetCache(unittest.TestCase):
+    def test_lru(self):
+        import numpy as np
+        from xlref.cache import SheetCache
+        cache = SheetCache(max_bytes=160)
+        for k in 'abc':
+            cache[k] = np.zeros(10)
+        self.assertEqual(list(cache), ['b', 'c'])
+        cache['b'], cache.get('a')
+        cache['d'] = np.zeros(10)
+        self.assertEqual(list(cache), ['b', 'd'])
+        self.assertEqual(cache.stats(), {
+            'entries': 2, 'nbytes': 160, 'derived_nbytes': 0,
+            'max_bytes': 160, 'hits': 1, 'misses': 1, 'evictions': 2
+        })
+
+    def test_lfu(self):
+        import numpy as np
+        from xlref.cache import SheetCache
+        cache = SheetCache(max_bytes=160, policy='lfu')
+        cache['a'], cache['b'] = np.zeros(10), np.zeros(10)
+        cache['a'], cache['a'], cache['b']
+        cache['c'] = np.zeros(10)
+        self.assertEqual(list(cache), ['a', 'c'])
+        self.assertRaises(ValueError, SheetCache, policy='fifo')
+
+    def test_books(self):
+        import numpy as np
+        from xlref.cache import SheetCache
+        from xlref.engines import OpenpyxlBook, LazySheet
+        cache, book = SheetCache(max_bytes=1), OpenpyxlBook(xl_file)
+        self.assertEqual(book.nbytes, osp.getsize(xl_file))
+        cache[xl_file] = book
+        sheet = cache[(book, 'ref')] = book.sheet('ref')
+        self.assertEqual(list(cache), [xl_file, (book, 'ref')])
+        sheet.band(0, 2, 0, 2)  # Sizes are updated when the sheet grows.
+        self.assertEqual(cache.nbytes, book.nbytes + sheet.nbytes)
+        cache['other'] = LazySheet(values=np.zeros((2, 2)))
+        self.assertEqual(list(cache), ['other'])  # Sheets before books.
+        self.assertIsNone(book._book)  # Closed.
+        self.assertEqual(cache.nbytes, cache['other'].nbytes)
+        self.assertEqual(sheet.watchers, {})
+
+    def test_ref(self):
+        from xlref.parser import Ref
+        from xlref.cache import SheetCache
+        cache = SheetCache()
+        ref = Ref(xl_file + '#ref!A1(RD):RD["recursive"]', cache=cache)
+        ref.values
+        self.assertGreaterEqual(len(cache), 2)
+        self.assertGreater(cache.nbytes, 0)
+        self.assertGreater(cache.hits, 0)
+        sheet = ref.lazy_sheet
+        self.assertIs(Ref('#A1(RD)', ref).full_cells, sheet.full_cells)
+        derived = cache.stats()['derived_nbytes']
+        self.assertGreaterEqual(derived, sheet.full_cells.nbytes)
+        self.assertEqual(sheet.nbytes - sheet.derived_nbytes, sum(
+            b.nbytes for _, _, b in sheet.columns.blocks
+        ) + sum(v.nbytes for v in sheet.columns.extra))
@@ -38,7 +38,50 @@ class TestImport(unittest.TestCase):
 
     def test_dir(self):
         self.assertEqual(dir(self.mdl), [
-            'FILTERS', 'Ref', 'XlParserError', '__author__', '__copyright__',
-            '__doc__', '__license__', '__title__', '__updated__', '__version__',
-            'dsp'
+            'DiskCache', 'ENGINES', 'FILTERS', 'Ref', 'SheetCache',
+            'XlParserError', '__author__', '__copyright__', '__doc__',
+            '__license__', '__title__', '__updated__', '__version__', 'dsp',
+            'parse_reference', 'read_many'
         ])
+
+
+def _importtime(*args):
+    import subprocess
+    import os.path as osp
+    env = dict(os.environ, PYTHONPATH=osp.dirname(osp.dirname(
+        osp.abspath(__file__)
+    )))
+    res = subprocess.run(
+        (sys.executable, '-X', 'importtime') + args, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    times = {}
+    for line in res.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cum, name = line.split('|')
+            if cum.strip().isdigit():
+                times[name.strip()] = int(cum) * 1e-6
+    return res.returncode, times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_cli(self):
+        code, times = _importtime('-c', 'import xlref.cli')
+        self.assertEqual(code, 0)
+        self.assertFalse({'numpy', 'pandas', 'schedula'}.intersection(times))
+        # Opt-in budget [s], since the wall-clock time depends on the runner.
+        budget = os.environ.get('XLREF_IMPORT_BUDGET')
+        if budget:
+            self.assertLess(times['xlref.cli'], float(budget))
+
+    def test_read(self):
+        import tempfile
+        import os.path as osp
+        fpath = osp.join(osp.dirname(__file__), 'files', 'excel.xlsx')
+        with tempfile.TemporaryDirectory() as d:
+            code, times = _importtime(
+                '-m', 'xlref.cli', 'read', osp.join(d, 'out.json'),
+                '%s#ref!A1:B2' % fpath
+            )
+        self.assertEqual(code, 0)
+        self.assertFalse({'pandas', 'schedula'}.intersection(times))
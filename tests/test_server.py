@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+import os
+import json
+import shutil
+import socket
+import tempfile
+import unittest
+import threading
+import os.path as osp
+
+files_dir = osp.join(osp.dirname(__file__), 'files')
+unix = unittest.skipUnless(
+    hasattr(socket, 'AF_UNIX'), 'Unix sockets are not supported.'
+)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp, ignore_errors=True)
+        self.csv = shutil.copy(osp.join(files_dir, 'test.csv'), self.temp)
+
+    def serve(self, address):
+        from xlref.server import make_server
+        server = make_server(address)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    @unix
+    def test_unix(self):
+        from xlref.server import read, request
+        from xlref.process import run
+        address = osp.join(self.temp, 'xlref.sock')
+        server = self.serve(address)
+        refs = ['%s#A1:C_' % self.csv, 'test.csv#A1', 'text']
+        out, exp = (osp.join(self.temp, k) for k in ('out.json', 'exp.json'))
+        cwd = os.getcwd()
+        os.chdir(self.temp)
+        self.addCleanup(os.chdir, cwd)
+        run(exp, refs)
+        misses = []
+        for _ in range(2):
+            read(address, out, refs)
+            misses.append(server.reader.cache.misses)
+            with open(out) as f, open(exp) as e:
+                self.assertEqual(json.load(f), json.load(e))
+        self.assertEqual(misses[0], misses[1])  # Warm cache.
+        with open(self.csv, 'a') as f:
+            f.write('\n9,9,9\n')
+        read(address, out, refs)
+        self.assertGreater(server.reader.cache.misses, misses[1])
+        with open(out) as f:
+            self.assertEqual(json.load(f)[0][-1], ['9', '9', '9'])
+        self.assertEqual(json.loads(request(address, 'GET', '/stats'))[
+            'entries'
+        ], 2)
+        self.assertRaises(RuntimeError, read, address, out, ['#X!A1'])
+        with self.assertRaises(RuntimeError):
+            request(address, 'POST', '/read', {'references': [{
+                'references': refs[:1]
+            }], 'format': 'json/../../out'})
+        self.assertEqual(len(server.reader._locks), 0)  # Released.
+
+    @unix
+    def test_address(self):
+        from xlref.server import make_server
+        address = osp.join(self.temp, 'xlref.sock')
+        make_server(address).server_close()  # Stale socket is replaced.
+        make_server(address).server_close()
+        self.assertRaises(FileExistsError, make_server, self.csv)
+        self.assertTrue(osp.isfile(self.csv))
+
+    def test_in_use(self):
+        from xlref.server import Reader
+        reader = Reader()
+        refs = [{'references': ['%s#A1' % self.csv]}]
+        reader.read(refs)
+        book = reader.cache[self.csv]
+        reader._use(self.csv)  # E.g., a nested reference of another request.
+        with open(self.csv, 'a') as f:
+            f.write('\n9,9,9\n')
+        reader.validate()
+        self.assertIs(reader.cache[self.csv], book)
+        reader._release([self.csv])
+        reader.validate()
+        self.assertNotIn(self.csv, reader.cache)
+
+    def test_no_unix(self):
+        from unittest import mock
+        from xlref.server import make_server
+        with mock.patch.dict(socket.__dict__):
+            socket.__dict__.pop('AF_UNIX', None)
+            with self.assertRaises(OSError):
+                make_server(osp.join(self.temp, 'xlref.sock'))
+
+    def test_cli(self):
+        from click.testing import CliRunner
+        import xlref.cli as cli
+        server = self.serve('127.0.0.1:0')
+        address = '127.0.0.1:%d' % server.server_address[1]
+        out = osp.join(self.temp, 'out.npz')
+        result = CliRunner().invoke(cli.read, [
+            out, '-S', address, '%s#A1:C2' % self.csv
+        ])
+        self.assertEqual(result.exit_code, 0, result)
+        self.assertTrue(osp.isfile(out))
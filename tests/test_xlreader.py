@@ -9,8 +9,11 @@ import os
 import ddt
 import json
 import shutil
+import tempfile
+import numpy as np
 import unittest
 import os.path as osp
+from importlib.util import find_spec
 import xlref.cli as cli
 from click.testing import CliRunner
 
@@ -51,6 +54,16 @@ class TestCMD(unittest.TestCase):
               files['json']], 0, 1),
             (['out4.json', '-F', files['json'], '-F', files['json']], 0, 1),
             (['out5.json', '%s#A1:..:DR' % files['csv']], 0, 1),
+            (['out4.json', '-j', '2', '-F', files['json'], '-F',
+              files['json']], 0, 1),
+            (['out4.json', '-j', '2', '-P', '-F', files['json'], '-F',
+              files['json']], 0, 1),
+            (['out6.npz', '%s#A1:..:DR' % files['csv']], 0, 1),
+            (['out5.json', '-I', '%s#A1:..:DR' % files['csv']], 0, 1),
+            (['out5.json', '-I', '%s#A1:..:DR' % files['csv']], 0, 1),
+            (['out1.json', '-C', 'cache',
+              '%s#ReF!B2:C_[{"fun":"dict","key":"lower","value":"ref"}]' %
+              files['xl']], 0, 1),
     ))
     def test_read(self, data):
         args, exit_code, file = data
@@ -70,3 +83,607 @@ class TestRange(unittest.TestCase):
     def test_range_repr(self):
         from xlref.parser import Range
         self.assertEqual(str(Range((1, 2), (5, 6))), 'C2:G6')
+
+
+class TestParseReference(unittest.TestCase):
+    def test_parse_reference(self):
+        from xlref.parser import parse_reference
+        from xlref.errors import InvalidSyntax, InvalidReference
+        ref = 'file.xlsx#Sheet!A1(RD):B_:L["T", {"fun": "dict"}]'
+        c = parse_reference(ref)
+        self.assertIs(c, parse_reference(ref))
+        self.assertNotEqual(c, parse_reference(ref.replace('"T", ', '')))
+        self.assertEqual({c: 1}[parse_reference(ref)], 1)
+        self.assertEqual((c.file, c.sheet, c.range_exp), (
+            'file.xlsx', 'Sheet', 'L'
+        ))
+        self.assertEqual(c.st_ref, ((0, 0), 'RD'))
+        self.assertEqual(c.nd_ref, (('_', 1), None))
+        self.assertEqual(c.filters, ('T', {'fun': 'dict'}))
+        with self.assertRaises(AttributeError):
+            c.file = 'other.xlsx'
+        for ref in ('text', 1.0, None, '#B'):
+            self.assertRaises(InvalidSyntax, parse_reference, ref)
+        self.assertRaises(InvalidReference, parse_reference, '#A1[{]')
+        with self.assertRaises(TypeError):
+            parse_reference('#A1[{"fun": "T", "kw": {}}]').filters[0]['a'] = 1
+
+    def test_subclass(self):
+        from xlref.parser import Ref
+
+        class MyRef(Ref):
+            @staticmethod
+            def _parse_filters(s):
+                return ['T']
+
+        ref = '%s#ref!A1:B1["full"]' % files['xl']
+        self.assertEqual(MyRef(ref).ref['filters'], ['T'])
+        self.assertEqual(Ref(ref).ref['filters'], ['full'])
+
+
+class TestFilters(unittest.TestCase):
+    def test_recursive(self):
+        from xlref.parser import Ref
+        from xlref.filters import recursive, ref
+        parent = Ref('%s#ref!A1' % files['xl'])
+        x = np.array([
+            [1.0, 'text', '#ref!E2', 'a#b'], [np.nan, '#F3', 2, '#ref!E2']
+        ], object)
+        res = recursive(parent, x)
+        self.assertEqual(res.shape, x.shape)
+        for r, v in zip(res.ravel(), x.ravel()):
+            self.assertEqual(str(r), str(ref(parent, v)))
+        self.assertIsNot(res[0, 2], res[1, 3])
+
+
+class TestReadMany(unittest.TestCase):
+    def test_read_many(self):
+        import xlref
+        from xlref.parser import Ref
+        from xlref.cache import SheetCache
+        refs = [
+            '%s#ref!E2:G3' % files['xl'], '%s#A1' % files['csv'],
+            '%s#ref!A1(RD):RD' % files['xl'], '%s#origin!A1' % files['xl']
+        ]
+        cache = SheetCache()
+        values = xlref.read_many(refs, cache=cache)
+        self.assertEqual(str(values), str([Ref(r).values for r in refs]))
+        self.assertEqual(len(cache), 5)
+        parent = Ref(refs[0], cache=cache)
+        self.assertEqual(str(Ref.resolve_many(['#E2', '#F3'], parent)), str(
+            [np.array([[1.0]]), np.array([[5.0]])]
+        ))
+
+    def test_resolve_many(self):
+        from xlref.parser import Ref
+        opened = []
+
+        class MyRef(Ref):
+            def _open_sheet(self, workbook, name):
+                opened.append(name)
+                return super(MyRef, self)._open_sheet(workbook, name)
+
+            @property
+            def values(self):
+                opened.append(self.ref['st_ref'])
+                return super(MyRef, self).values
+
+        refs = ['%s#%s!%s' % (files['xl'], s, c) for s, c in (
+            ('ref', 'E2'), ('origin', 'A1'), ('REF', 'F3')
+        )]
+        values = MyRef.resolve_many(refs)
+        self.assertEqual(str(values), str([Ref(r).values for r in refs]))
+        self.assertEqual(opened, [
+            ((1, 4), None), 'ref', ((2, 5), None), ((0, 0), None), 'origin'
+        ])
+
+
+class TestZeroCopy(unittest.TestCase):
+    def test_zero_copy(self):
+        from xlref.parser import Ref
+        from xlref.cache import SheetCache
+        from unittest import mock
+        from xlref.filters import FILTERS, mutates
+
+        class ZeroCopyRef(Ref):
+            zero_copy = True
+
+        cache, ref = SheetCache(), '%s#ref!E2:G4' % files['xl']
+        a, b = ZeroCopyRef(ref, cache=cache), ZeroCopyRef(ref, cache=cache)
+        a.lazy_sheet.columns
+        self.assertTrue(np.shares_memory(a.values, b.values))
+        self.assertFalse(a.values.flags.writeable)
+        with mock.patch('xlref.parser.writable') as writable:
+            values = Ref(ref + '["T"]', cache=cache).values
+        writable.assert_not_called()  # Copied once, without scans.
+        self.assertTrue(values.flags.writeable)
+        values = Ref(ref, cache=cache).values
+        self.assertTrue(values.flags.writeable)
+        self.assertFalse(np.shares_memory(a.values, values))
+        FILTERS['negate'] = mutates(lambda parent, x: np.negative(x, out=x))
+        try:
+            values = ZeroCopyRef(ref + '["negate"]', cache=cache).values
+        finally:
+            FILTERS.pop('negate')
+        self.assertEqual(values[:, 0].tolist(), [-1, -4, -7])
+        self.assertEqual(a.values[:, 0].tolist(), [1, 4, 7])
+        empty = ZeroCopyRef('%s#ref!A1000:B1001' % files['xl'], cache=cache)
+        self.assertEqual(empty.values.strides, (0, 0))
+
+    def test_writable(self):
+        from xlref.filters import writable
+        a, b = np.arange(2.), np.arange(3.)
+        a.flags.writeable = False
+        nested = np.empty(1, object)
+        nested[0] = a
+        x = {'a': [a, (a, b)], 'b': nested, 'c': b}
+        y = writable(x)
+        self.assertTrue(y['a'][0].flags.writeable)
+        self.assertTrue(y['a'][1][0].flags.writeable)
+        self.assertTrue(y['b'][0].flags.writeable)
+        self.assertIs(y['c'], b)
+        self.assertFalse(x['a'][0].flags.writeable)
+        self.assertIs(writable(x['c']), b)
+
+
+class TestEngines(unittest.TestCase):
+    def test_openpyxl(self):
+        from xlref.engines import OpenpyxlBook
+        book = OpenpyxlBook(files['xl'])
+        self.assertEqual(book.sheet_indices, {'origin': 0, 'ref': 1})
+        grid = book.parse('origin')
+        self.assertEqual(grid.dtype, object)
+        self.assertEqual(grid.shape, (4, 2))
+        self.assertEqual(grid[2].tolist(), ['merge-1', 4])
+        self.assertIs(type(grid[2, 1]), int)
+        self.assertTrue(all(v != v for v in grid[1]))
+        book.close()
+
+    def test_xlsx(self):
+        from xlref.parser import Ref
+        from xlref.engines import ENGINES, OpenpyxlBook, XlsxBook
+
+        class MyRef(Ref):
+            _engines = dict(ENGINES, xlsx=XlsxBook)
+
+        for fpath in (files['xl'], osp.join(files_dir, 'test.xlsx')):
+            book, base = XlsxBook(fpath), OpenpyxlBook(fpath)
+            self.assertEqual(book.sheet_names, base.sheet_names)
+            for name in book.sheet_names:
+                sheet, other = book.sheet(name), base.sheet(name)
+                self.assertEqual(
+                    str(sheet.values.tolist()), str(other.values.tolist())
+                )
+                self.assertTrue(np.array_equal(
+                    sheet.full_cells, other.columns.full_cells()
+                ))
+            book.close()
+            base.close()
+        ref = MyRef('%s#ref!E2:G3' % files['xl'])
+        self.assertEqual(ref.values.tolist(), [[1, 2, 3], [4, 5, 6]])
+        self.assertTrue(ref.full_cells.any())
+        # Only the strings of the numeric columns (headers) are decoded.
+        self.assertEqual(ref.book.strings.decoded, 3)
+        self.assertEqual(len(ref.book.strings), 59)
+        ref = MyRef('%s#ref!A1(RD):RD["dict"]' % files['xl'])
+        self.assertEqual(
+            str(ref.values), str(Ref('%s#ref!A1(RD):RD["dict"]' % files[
+                'xl'
+            ]).values)
+        )
+        ref.book.close()
+
+    def test_csv(self):
+        from xlref.parser import Ref
+        from xlref.engines import ENGINES, TsvBook
+
+        class ChunkedTsvBook(TsvBook):
+            chunksize = 2
+
+        class MyRef(Ref):
+            _engines = dict(ENGINES, tsv=ChunkedTsvBook)
+
+        with tempfile.TemporaryDirectory() as d:
+            fpath = osp.join(d, 'test.tsv')
+            with open(fpath, 'w') as f:
+                f.write('\n'.join('a\t%d\t%d' % (i, i * 2) for i in range(9)))
+            ref = Ref('%s#B2:C3' % fpath)
+            self.assertEqual(ref.values.tolist(), [[1, 2], [2, 4]])
+            self.assertTrue(ref.full_cells.all())
+            ref = MyRef('%s#B2:C3' % fpath)
+            self.assertEqual(ref.values.tolist(), [[1, 2], [2, 4]])
+            self.assertEqual(len(ref.lazy_sheet.load(0)), 3)
+            self.assertEqual(ref.lazy_sheet.values.shape, (9, 3))
+            with open(fpath, 'w') as f:
+                f.write('1\t2.5\tb\n3\t\t#N/A\n\t\t\n')
+            ref = '%s#A1:C2' % fpath
+            values = Ref(ref).values
+            self.assertEqual(str(values), str(MyRef(ref).values))
+            self.assertIs(type(values[1, 0]), int)
+            sheet = Ref(ref).lazy_sheet
+            self.assertEqual(sheet.columns.shape, (2, 3))
+            self.assertEqual(sheet.derived['full_cells'].sum(), 4)
+
+        class PyarrowTsvBook(ChunkedTsvBook):
+            parser = 'pyarrow'
+
+        with self.assertRaises(ValueError):
+            PyarrowTsvBook(fpath)
+
+    def test_registry(self):
+        from xlref.parser import Ref
+        from xlref.engines import ENGINES, Book
+
+        class MyBook(Book):
+            sheet_names = ['Data']
+
+            def iter_rows(self, name):
+                return iter([(None, 1), ('a', None, 2)])
+
+        class MyRef(Ref):
+            _engines = dict(ENGINES, my=MyBook)
+
+        ref = MyRef('%s#^^:__' % osp.join(files_dir, 'test.my'))
+        self.assertIsInstance(ref.book, MyBook)
+        self.assertEqual(str(ref.range), 'A1:C2')
+        self.assertEqual(ref.values.shape, (2, 3))
+
+
+class TestLazySheet(unittest.TestCase):
+    def test_bounded(self):
+        from xlref.parser import Ref
+        ref = Ref('%s#ref!E2:G3' % files['xl'])
+        self.assertEqual(ref.values.tolist(), [[1, 2, 3], [4, 5, 6]])
+        self.assertFalse(ref.lazy_sheet.loaded)
+        self.assertEqual(len(ref.lazy_sheet.load(0)), 3)
+
+    def test_band(self):
+        from xlref.engines import LazySheet
+        sheet = LazySheet([(None, 1), ('a', None, 2), (None,)])
+        self.assertEqual(sheet.band(1, 2, 0, 2).tolist(), [['a', np.nan]])
+        self.assertFalse(sheet.loaded)
+        self.assertEqual(sheet.values.shape, (2, 3))
+        self.assertIs(sheet.values, sheet.values)
+        self.assertFalse(sheet.values.flags.writeable)
+        self.assertEqual(sheet.band(1, 3, 2, 4).shape, (2, 2))
+
+    def test_columns(self):
+        import datetime
+        from xlref.engines import Columns
+        d = datetime.datetime(2020, 1, 1)
+        grid = np.array([
+            ['a', 'b', 'c', 'd'], [1, d, 'x', True], [2, np.nan, 'y', 1.5],
+            [3, d, 4, np.nan]
+        ], object)
+        columns = Columns.from_grid(grid)
+        self.assertEqual(
+            [(c0, c1, b.dtype.kind) for c0, c1, b in columns.blocks],
+            [(0, 1, 'f'), (1, 2, 'M'), (2, 4, 'O')]
+        )
+        self.assertEqual(str(columns.grid().tolist()), str(grid.tolist()))
+        self.assertEqual(columns.full_cells().sum(), 14)
+        self.assertEqual(columns.band(1, 5, 0, 1).dtype, float)
+        self.assertEqual(columns.band(1, 4, 1, 2).dtype.kind, 'M')
+        self.assertEqual(columns.band(0, 4, 0, 1).dtype, object)
+        self.assertEqual(columns.band(3, 4, 0, 3).tolist(), [[3, d, 4]])
+        self.assertEqual(columns.band(2, 4, 2, 3).dtype, object)
+        self.assertEqual(columns.band(3, 6, 2, 4).dtype, float)
+
+    def test_large_ints(self):
+        import warnings
+        from xlref.engines import Columns
+        grid = np.array([[v, 'h'] for v in (
+            1e20, 2.0 ** 63, -1e300, 3.0, 1.5
+        )], object)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            values = Columns.from_grid(grid).grid()
+        self.assertEqual(values[:, 0].tolist(), [
+            10 ** 20, 2 ** 63, int(-1e300), 3, 1.5
+        ])
+        self.assertEqual({type(v) for v in values[:4, 0]}, {int})
+
+
+class TestPlan(unittest.TestCase):
+    def test_plan(self):
+        from xlref.process import plan_references, _FileRefs
+        with open(files['json']) as f:
+            refs = [_FileRefs(json.load(f), files['json'])]
+        refs.append('%s#A1' % files['csv'])
+        plan = plan_references(refs + ['text', '%s#REF!A1' % files['xl']])
+        self.assertEqual(plan, {
+            files['xl']: ['ref'], files['csv']: [''],
+            osp.join(files_dir, 'test.xlsx'): ['sheet1']
+        })
+
+    def test_preload(self):
+        from xlref.cache import SheetCache
+        from xlref.process import read_references
+        refs = ['%s#ref!B2:C3' % files['xl'], '%s#nosheet!A1' % files['xl'],
+                '%s#A1' % files['csv']]
+        cache = SheetCache()
+        res = read_references(refs[::2], cache=cache, jobs=2)
+        self.assertEqual(len(cache), 4)
+        self.assertTrue(all(
+            s.loaded for k, s in cache.items() if isinstance(k, tuple)
+        ))
+        self.assertEqual(str(res), str(read_references(refs[::2])))
+        self.assertRaises(KeyError, read_references, refs, jobs=2)
+
+    def test_processes(self):
+        from xlref.cache import SheetCache
+        from xlref.process import read_references
+        refs = ['%s#ref!B2:C3' % files['xl'], '%s#nosheet!A1' % files['xl'],
+                '%s#A1' % files['csv']]
+        cache = SheetCache()
+        res = read_references(refs[::2], cache=cache, jobs=2, processes=True)
+        self.assertEqual(str(res), str(read_references(refs[::2])))
+        sheets = [s for k, s in cache.items() if isinstance(k, tuple)]
+        self.assertEqual(len(sheets), 2)
+        self.assertTrue(any(
+            isinstance(b, np.memmap) for s in sheets
+            for _, _, b in s.columns.blocks
+        ))
+        self.assertRaises(
+            KeyError, read_references, refs, jobs=2, processes=True
+        )
+
+    def test_processes_no_shm(self):
+        from unittest import mock
+        from xlref.cache import SheetCache
+        from xlref.process import read_references
+        refs, cache = ['%s#ref!B2:C3' % files['xl']], SheetCache()
+        with tempfile.TemporaryDirectory() as d, \
+                mock.patch('xlref.shared._shm_dir', return_value=None), \
+                mock.patch('tempfile.tempdir', d):
+            res = read_references(refs, cache=cache, jobs=1, processes=True)
+            self.assertEqual(os.listdir(d), [])  # Removed.
+        self.assertEqual(str(res), str(read_references(refs)))
+        self.assertFalse(any(
+            isinstance(b, np.memmap) for k, s in cache.items()
+            if isinstance(k, tuple) for _, _, b in s.columns.blocks
+        ))
+
+
+class TestWriters(unittest.TestCase):
+    def test_stream(self):
+        import simplejson
+        from xlref.process import save_json, _json_default
+        data = [np.arange(9000.).reshape(2, 4500), {1: np.array([np.nan])},
+                np.array([[1, 'a'], [np.inf, None]], object), 'text']
+        with tempfile.TemporaryDirectory() as d:
+            fpath = save_json(osp.join(d, 'out.json'), iter(data))
+            with open(fpath) as f:
+                self.assertEqual(f.read(), simplejson.dumps(
+                    data, default=_json_default, ignore_nan=True
+                ))
+            self.assertRaises(TypeError, save_json, fpath, iter([{(1,): 2}]))
+            with open(fpath) as f:  # The previous output is kept.
+                self.assertEqual(json.load(f)[-1], 'text')
+            self.assertEqual(os.listdir(d), ['out.json'])
+
+    def test_npz(self):
+        from xlref.process import save_npz
+        data = [np.array([[1.0, 2.0], [3.0, np.nan]], object),
+                {'a': [np.array(['x', 1], object)], 'b/c': 'text',
+                 'b%2Fc': [1, 2]}]
+        with tempfile.TemporaryDirectory() as d:
+            with np.load(save_npz(osp.join(d, 'out.npz'), iter(data)),
+                         allow_pickle=True) as f:
+                self.assertEqual(list(f), ['0', '1/a', '1/b%2Fc', '1/b%252Fc'])
+                self.assertEqual(f['0'].dtype, float)
+                np.testing.assert_array_equal(f['0'], data[0].astype(float))
+                self.assertEqual(f['1/a'].shape, (1,))
+                self.assertEqual(f['1/a'][0].tolist(), ['x', 1])
+                self.assertEqual(f['1/b%2Fc'], 'text')
+                self.assertEqual(f['1/b%252Fc'].tolist(), [1.0, 2.0])
+
+    @unittest.skipUnless(find_spec('pyarrow'), 'pyarrow is not installed.')
+    def test_arrow(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from xlref.process import save_parquet, save_arrow
+        data = [np.array([[1.0, 2.0], [3.0, np.nan]]),
+                {'a': np.array([['x', 1]], object), 'b': 'text'}]
+        with tempfile.TemporaryDirectory() as d:
+            arrow = save_arrow(osp.join(d, 'out.arrow'), iter(data))
+            with pa.OSFile(arrow, 'rb') as f:
+                tables = [pa.ipc.open_file(f).read_all()]
+            tables.append(pq.read_table(
+                save_parquet(osp.join(d, 'out.parquet'), iter(data))
+            ))
+            for table in tables:
+                res = table.to_pylist()[0]
+                self.assertEqual(table.column_names, ['0', '1/a', '1/b'])
+                self.assertEqual(res['0'], [[1.0, 2.0], [3.0, None]])
+                self.assertEqual(res['1/a'], [['x', '1']])
+                self.assertEqual(res['1/b'], 'text')
+
+
+class TestIncremental(unittest.TestCase):
+    def test_dependencies(self):
+        from xlref.parser import Ref, track_dependencies
+        from xlref.manifest import file_state
+        with tempfile.TemporaryDirectory() as d:
+            csv = shutil.copy(files['csv'], d)
+            state = file_state(csv)
+            with track_dependencies() as deps:
+                Ref('%s#A1' % csv).values
+                with open(csv, 'a') as f:  # Changed after reading.
+                    f.write('\n')
+                Ref('%s#A2' % csv).values
+        self.assertEqual(deps, {csv: state})
+
+    def test_incremental(self):
+        import xlref
+        from unittest import mock
+        from xlref.process import iter_references
+        with tempfile.TemporaryDirectory() as d:
+            os.chdir(d)
+            self.addCleanup(os.chdir, test_dir)
+            for k in ('csv', 'xl'):
+                shutil.copy(files[k], d)
+            csv, xl = (osp.join(d, osp.basename(files[k]))
+                       for k in ('csv', 'xl'))
+            out = osp.join(d, 'out.json')
+            refs = ['%s#A1' % csv, '%s#ref!B2:C3' % xl, 'text']
+            inputs = {'input_references': refs, 'output_fpath': out,
+                      'incremental': True}
+
+            def run():
+                with mock.patch('xlref.process.iter_references',
+                                wraps=iter_references) as m:
+                    sol = xlref.dsp(inputs, ['written', 'manifest_fpath'])
+                self.assertIn('manifest_fpath', sol)
+                with open(out) as f:
+                    return m.call_args[0][0], json.load(f)
+
+            todo, res = run()
+            self.assertEqual(todo, refs)
+            with open(out + '.manifest.json') as f:
+                manifest = json.load(f)
+            self.assertEqual([e['files'] for e in manifest['entries']],
+                             [[csv], [xl], []])
+            self.assertEqual(run(), ([], res))
+            with open(csv, 'a') as f:
+                f.write('\n')
+            self.assertEqual(run(), ([refs[0]], res))
+            os.utime(xl)  # Touched files are not read again.
+            self.assertEqual(run(), ([], res))
+
+
+class TestInstrument(unittest.TestCase):
+    def test_collector(self):
+        from xlref.parser import Ref
+        from xlref.cache import SheetCache
+        from xlref.instrument import Collector
+        cache, ref = SheetCache(), '%s#ref!A1(RD):RD["T"]' % files['xl']
+        with Collector() as c:
+            Ref(ref, cache=cache).values
+            Ref(ref, cache=cache).values
+        self.assertEqual(c.stages['ref.values']['calls'], 2)
+        self.assertEqual(c.stages['filter.T']['calls'], 2)
+        self.assertGreater(c.stages['ref.book']['nbytes'], 0)
+        self.assertEqual(c.lookups[(files['xl'], 'ref')], [1, 1])
+        self.assertIn('ref.values', c.table())
+        Ref(ref, cache=cache).values
+        self.assertEqual(c.stages['ref.values']['calls'], 2)
+        self.assertGreater(c.stages['ref.open_sheet']['nbytes'], 0)
+
+    def test_stream(self):
+        from xlref.instrument import Collector
+        from xlref.process import read_references
+        refs = ['%s#ref!A1(RD):RD' % files['xl'], '%s#A1' % files['csv']]
+        with Collector() as c:
+            it = read_references(refs, jobs=2, stream=True)
+            self.assertNotIn('process.read_references', c.stages)
+            self.assertEqual(len(list(it)), 2)
+        stage = c.stages['process.read_references']
+        self.assertEqual(stage['calls'], 1)
+        self.assertGreaterEqual(stage['seconds'], c.stages['ref.values'][
+            'seconds'
+        ])
+        self.assertEqual(c.stages['ref.book']['calls'], 2)  # Preloaded.
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as d:
+            result = CliRunner().invoke(cli.read, [
+                osp.join(d, 'out.json'), '--profile', '%s#A1' % files['csv']
+            ])
+        self.assertEqual(result.exit_code, 0, result)
+        self.assertIn('process.write_output', result.output)
+
+
+def _grid_ref(grid):
+    # Reference of the first cell of an in-memory sheet.
+    from xlref.parser import Ref
+    from xlref.engines import LazySheet
+    ref = Ref('#A1')
+    ref.ref['xl_sheet'] = LazySheet(values=grid.astype(object))
+    return ref
+
+
+def _target_full_scan(full_cells, cell, moves):
+    from xlref.parser import _primitive_dir
+    idx = np.array(np.where(full_cells)).T
+    up, dn = (0, 0), tuple(idx.max(0)) if idx.shape[0] else (0, 0)
+    c0 = np.array(cell)
+    if 'U' in moves and not c0[0] <= dn[0]:
+        c0[0] = dn[0]
+    if 'L' in moves and not c0[1] <= dn[1]:
+        c0[1] = dn[1]
+    while (up <= c0).all() and (c0 <= dn).all():
+        c1 = c0.copy()
+        while (up <= c1).all():
+            try:
+                if full_cells[c1[0], c1[1]]:
+                    return tuple(c1)
+            except IndexError:
+                break
+            c1 += _primitive_dir[moves[0]]
+        try:
+            c0 += _primitive_dir[moves[1]]
+        except IndexError:
+            break
+
+
+class TestTargetFull(unittest.TestCase):
+    def test_moves(self):
+        from xlref.errors import NoFullCell
+        moves = 'L', 'U', 'R', 'D', 'LD', 'LU', 'UL', 'UR', 'RU', 'RD', 'DL', \
+                'DR'
+        rnd = np.random.RandomState(0)
+        for density in (0, .05, .3):
+            ref = _grid_ref(np.where(rnd.rand(9, 7) < density, 1.0, np.nan))
+            for cell in np.ndindex(11, 9):
+                for mv in moves:
+                    exp = _target_full_scan(ref.full_cells, cell, mv)
+                    try:
+                        res = tuple(ref._target_full(cell, mv))
+                    except NoFullCell:
+                        res = None
+                    self.assertEqual(exp, res, (density, cell, mv))
+
+
+def _expand_range_scan(full_cells, margins, st, nd, range_exp):
+    from xlref.parser import _primitive_dir
+    range_exp, exp = range_exp.upper(), np.zeros((2, 2), int)
+    for k, i in (('L', 0), ('U', 0), ('R', 1), ('D', 1)):
+        exp[:, i] += _primitive_dir[k] * range_exp.count(k)
+    empty, r0 = ~full_cells, np.array((st, nd), int)
+    rng = r0.T + [0, 1]
+    b = np.array([all(empty[slice(*rng[0]), slice(*rng[1])].shape)])
+    margins = np.array([(m['^'], m['_'] + 1) for m in margins]).T
+    while b.any():
+        empty[slice(*rng[0]), slice(*rng[1])] = True
+        r = np.clip(rng + exp, margins[0, :, None], margins[1, :, None])
+        b = ~np.array([
+            empty[r[0] - [0, 1], slice(*r[1])].all(1),
+            empty[slice(*r[0]), r[1] - [0, 1]].all(0)
+        ])
+        if (np.where(b, r, rng) == rng).all():
+            break  # The original implementation loops forever.
+        rng = np.where(b, r, rng)
+    r = (rng - [0, 1]).T
+    return tuple(np.minimum(r[0], r0[0])), tuple(np.maximum(r[1], r0[1]))
+
+
+class TestExpandRange(unittest.TestCase):
+    def test_expansions(self):
+        rnd = np.random.RandomState(0)
+        for density, shape in ((0, (12, 9)), (.1, (12, 9)), (.4, (12, 9)),
+                               (.8, (12, 9)), (.95, (60, 30))):
+            ref = _grid_ref(np.where(rnd.rand(*shape) < density, 1.0, np.nan))
+            for _ in range(200):
+                st = tuple(rnd.randint(0, 12, 2))
+                nd = tuple(np.add(st, rnd.randint(0, 3, 2)))
+                exp = ''.join(rnd.choice(list('LURD'), rnd.randint(1, 6)))
+                try:
+                    res = _expand_range_scan(
+                        ref.full_cells, ref.margins, st, nd, exp
+                    )
+                except IndexError:
+                    continue
+                self.assertEqual(
+                    res, ref._expand_range(st, nd, exp), (st, nd, exp)
+                )
@@ -18,11 +18,18 @@ Modules:
     :nosignatures:
     :toctree: toctree/xlref
 
+    aio
+    cache
     cli
+    engines
     errors
     filters
+    instrument
+    manifest
     parser
     process
+    server
+    shared
 """
 import os
 import sys
@@ -32,6 +39,11 @@ from ._version import *
 _all = {
     'XlParserError': '.errors',
     'Ref': '.parser',
+    'parse_reference': '.parser',
+    'read_many': '.parser',
+    'ENGINES': '.engines',
+    'SheetCache': '.cache',
+    'DiskCache': '.cache',
     'FILTERS': '.filters',
     'dsp': '.process'
 }
@@ -57,7 +69,9 @@ def __getattr__(name):
 
 
 if sys.version_info[:2] < (3, 7) or os.environ.get('IMPORT_ALL') == 'True':
-    from .parser import Ref
+    from .parser import Ref, parse_reference, read_many
     from .filters import FILTERS
+    from .engines import ENGINES
+    from .cache import SheetCache, DiskCache
     from .errors import XlParserError
     from .process import dsp
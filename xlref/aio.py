@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the asyncio API to read references without blocking the event
+loop.
+"""
+import io
+import asyncio
+import inspect
+import weakref
+import os.path as osp
+from .instrument import in_context
+
+#: Pending loads and locks of the caches (by id), per event loop.
+_states = weakref.WeakKeyDictionary()
+
+
+class _State:
+    """Pending workbook loads and resolution locks of a cache."""
+
+    def __init__(self):
+        self.loads, self.locks = {}, {}
+
+    def lock(self, fpath):
+        if fpath not in self.locks:
+            self.locks[fpath] = asyncio.Lock()
+        return self.locks[fpath]
+
+
+def _state(cache, loop):
+    # Locks and futures are bound to their loop.
+    states = _states.setdefault(loop, {})
+    state = states.get(id(cache))
+    if state is None:
+        states[id(cache)] = state = _State()
+        weakref.finalize(cache, states.pop, id(cache), None)
+    return state
+
+
+def _opener(opener, loop):
+    # Blocking opener of the executor threads, awaiting `opener` on the loop.
+    def _open(fpath, mode='rb'):
+        future = asyncio.run_coroutine_threadsafe(opener(fpath), loop)
+        return io.BytesIO(future.result())
+
+    return _open
+
+
+def _parser(p, opener, loop):
+    if inspect.iscoroutinefunction(opener):
+        p._open = _opener(opener, loop)
+    elif opener is not None:
+        p._open = opener
+    return p
+
+
+async def _load(pclass, fpath, cache, store, opener, executor):
+    loop = asyncio.get_running_loop()
+    p = _parser(pclass('%s#A1' % fpath, cache=cache, store=store), opener,
+                loop)
+    await loop.run_in_executor(
+        executor, in_context(lambda: p.book.sheet_names)
+    )
+
+
+async def read(ref, cache=None, store=None, opener=None, executor=None,
+               pclass=None):
+    """
+    Read a reference, loading the workbook on an executor.
+
+    Concurrent loads of the same workbook are shared, while the references
+    of the same workbook are resolved one at a time.
+
+    :param ref:
+        Reference string with file name.
+    :type ref: str
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :param opener:
+        File opener like `open` or coroutine function that returns the file
+        content as bytes (e.g., from an object store).
+    :type opener: callable
+
+    :param executor:
+        Executor where workbooks are loaded and references resolved (`None`
+        is the default executor of the loop).
+    :type executor: concurrent.futures.Executor
+
+    :param pclass:
+        Reference parser class.
+    :type pclass: type
+
+    :return:
+        Captured values.
+    :rtype: object
+    """
+    from .cache import SheetCache
+    from .parser import Ref
+    from .errors import InvalidReference
+    pclass = Ref if pclass is None else pclass
+    cache = SheetCache() if cache is None else cache
+    loop = asyncio.get_running_loop()
+    # Evicted workbooks and nested references are opened with `opener` too.
+    p = _parser(pclass(ref, cache=cache, store=store), opener, loop)
+    if not p.ref['file']:
+        raise InvalidReference(ref, 'Missing file name.')
+    fpath = osp.abspath(osp.join(p._curr_dir, p.ref['file']))
+    state = _state(cache, loop)
+    task = state.loads.get(fpath)
+    if task is None and fpath not in cache:
+        state.loads[fpath] = task = asyncio.ensure_future(
+            _load(pclass, fpath, cache, store, opener, executor)
+        )
+        task.add_done_callback(lambda t: state.loads.pop(fpath, None))
+    if task is not None:
+        await task
+    async with state.lock(fpath):
+        return await loop.run_in_executor(executor, in_context(
+            lambda: p.values
+        ))
+
+
+async def read_many(refs, cache=None, store=None, opener=None,
+                    executor=None, pclass=None):
+    """
+    Read concurrently many references, sharing the parsed workbooks.
+
+    :param refs:
+        Reference strings with file name.
+    :type refs: collections.abc.Iterable[str]
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :param opener:
+        File opener like `open` or coroutine function that returns the file
+        content as bytes (e.g., from an object store).
+    :type opener: callable
+
+    :param executor:
+        Executor where workbooks are loaded and references resolved (`None`
+        is the default executor of the loop).
+    :type executor: concurrent.futures.Executor
+
+    :param pclass:
+        Reference parser class.
+    :type pclass: type
+
+    :return:
+        Captured values, in the same order of the references.
+    :rtype: list
+    """
+    from .cache import SheetCache
+    cache = SheetCache() if cache is None else cache
+    return list(await asyncio.gather(*(
+        read(r, cache, store, opener, executor, pclass) for r in refs
+    )))
@@ -0,0 +1,508 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the caches of the parsed sheets.
+"""
+import os
+import json
+import mmap
+import uuid
+import shutil
+import hashlib
+import logging
+import functools
+import threading
+import collections.abc
+import numpy as np
+import os.path as osp
+from .engines import (
+    Book, Columns, LazySheet, SharedStrings, StringBlock
+)
+
+log = logging.getLogger(__name__)
+
+
+def _sizeof(value):
+    return getattr(value, 'nbytes', 0)
+
+
+class SheetCache(collections.abc.MutableMapping):
+    """
+    Bounded and thread-safe in-memory cache of the workbooks and sheets.
+
+    The memory usage is measured by the `nbytes` of the cached values (updated
+    when the cached sheets grow), when the `max_bytes` budget is exceeded the
+    entries are evicted according to the `policy` (i.e., `'lru'` least
+    recently used or `'lfu'` least frequently used). The workbooks are evicted
+    (and closed) only after their cached sheets.
+
+    :param max_bytes:
+        Memory budget in bytes (`None` means unbounded).
+    :type max_bytes: int
+
+    :param policy:
+        Eviction policy (`'lru'` or `'lfu'`).
+    :type policy: str
+    """
+
+    def __init__(self, max_bytes=None, policy='lru'):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('Invalid eviction policy %r.' % policy)
+        self.max_bytes, self.policy = max_bytes, policy
+        self._data = collections.OrderedDict()
+        self._sizes, self._uses = {}, collections.Counter()
+        self._sheets = collections.Counter()  # Cached sheets by book id.
+        self._total = 0
+        self._lock = threading.RLock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _resize(self, key, value):
+        size = _sizeof(value)
+        self._total += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def _grown(self, key, value):  # Called by the growing sheets.
+        with self._lock:
+            if self._data.get(key) is value:
+                self._resize(key, value)
+                self._evict(key)
+
+    @property
+    def nbytes(self):
+        """Memory used by the cached values."""
+        with self._lock:
+            return self._total
+
+    def _evictable(self, key, keep):
+        if key == keep:
+            return False
+        return not isinstance(self._data[key], Book) or \
+            not self._sheets[id(self._data[key])]
+
+    def _evict(self, keep):
+        data = self._data
+        while self.max_bytes is not None and self._total > self.max_bytes:
+            keys = (k for k in data if self._evictable(k, keep))
+            if self.policy == 'lfu':
+                key = min(keys, key=self._uses.get, default=None)
+            else:
+                key = next(keys, None)
+            if key is None:
+                break
+            value = self._pop(key)
+            if isinstance(value, Book):
+                value.close()
+            self.evictions += 1
+
+    def _pop(self, key):
+        self._total -= self._sizes.pop(key, 0)
+        self._uses.pop(key, None)
+        value = self._data.pop(key)
+        getattr(value, 'watchers', {}).pop(id(self), None)
+        if isinstance(key, tuple) and isinstance(key[0], Book):
+            self._sheets[id(key[0])] -= 1
+        return value
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self.hits += 1
+            self._uses[key] += 1
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            uses = self._uses[key]
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = value
+            self._uses[key] = uses + 1
+            if isinstance(key, tuple) and isinstance(key[0], Book):
+                self._sheets[id(key[0])] += 1
+            watchers = getattr(value, 'watchers', None)
+            if watchers is not None:
+                watchers[id(self)] = functools.partial(self._grown, key)
+            self._resize(key, value)
+            self._evict(key)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._pop(key)
+
+    def stats(self):
+        """
+        Return the cache statistics.
+
+        The `nbytes` includes the `derived_nbytes` of the structures derived
+        from the cached sheets (e.g., `full_cells`, `margins` and indexes).
+
+        :return:
+            Cache statistics.
+        :rtype: dict
+        """
+        with self._lock:
+            derived = sum(
+                getattr(v, 'derived_nbytes', 0) for v in self._data.values()
+            )
+            return {
+                'entries': len(self._data), 'nbytes': self.nbytes,
+                'derived_nbytes': derived,
+                'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions
+            }
+
+
+def _file_hash(fpath, size=1 << 20):
+    h = hashlib.sha256()
+    with open(fpath, 'rb') as f:
+        for chunk in iter(lambda: f.read(size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _dir_size(path):
+    return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+
+class DiskCache:
+    """
+    Persistent on-disk cache of the parsed sheets.
+
+    Workbook entries are keyed by absolute path, modification time, size and
+    (optionally) content hash, so they are invalidated when the source file
+    changes. The typed column blocks of each sheet and its `full_cells` mask
+    are stored as `.npy` files (memory-mapped when they are not of object
+    dtype), while sheet names and margins are stored in the entry metadata.
+    The coded string blocks are stored as their codes plus the workbook shared
+    strings and offsets, so they are decoded on demand as when parsed. The
+    other `object` blocks and the cells stored apart are pickled, hence they
+    are not memory-mapped but fully loaded on each warm read.
+    The least recently used entries are evicted when the cache exceeds
+    `max_bytes`.
+
+    :param directory:
+        Cache directory.
+    :type directory: str
+
+    :param max_bytes:
+        Maximum size of the cache on disk (`None` means unbounded).
+    :type max_bytes: int
+
+    :param content_hash:
+        Include the file content hash in the entry key.
+    :type content_hash: bool
+    """
+
+    def __init__(self, directory, max_bytes=None, content_hash=False):
+        self.directory = osp.abspath(directory)
+        self.max_bytes, self.content_hash = max_bytes, content_hash
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, fpath):
+        """
+        Return the cache key of a file.
+
+        :param fpath:
+            File path.
+        :type fpath: str
+
+        :return:
+            Cache key.
+        :rtype: str
+        """
+        fpath = osp.abspath(fpath)
+        stat = os.stat(fpath)
+        key = [fpath, stat.st_mtime_ns, stat.st_size]
+        if self.content_hash:
+            key.append(_file_hash(fpath))
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+    def book(self, book):
+        """
+        Wrap a workbook engine to read and write its sheets from the cache.
+
+        :param book:
+            Workbook engine.
+        :type book: xlref.engines.Book
+
+        :return:
+            Cached workbook engine (or the input if the file is not on disk).
+        :rtype: xlref.engines.Book
+        """
+        try:
+            return StoredBook(book, self, self.key(book.fpath))
+        except OSError:  # File not on disk (e.g., custom opener).
+            return book
+
+    def _path(self, key, *names):
+        return osp.join(self.directory, key, *names)
+
+    def read_meta(self, key):
+        try:
+            with open(self._path(key, 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self, key, meta):
+        if not osp.isdir(self._path(key)):
+            self.invalidate(meta['fpath'])
+            os.makedirs(self._path(key), exist_ok=True)
+        fpath = self._path(key, 'meta.json')
+        tmp = '%s.%s.tmp' % (fpath, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, fpath)
+
+    def load(self, key, name):
+        """
+        Load a sheet from the cache.
+
+        :param key:
+            Cache key of the workbook.
+        :type key: str
+
+        :param name:
+            Lower sheet name.
+        :type name: str
+
+        :return:
+            Cached sheet or `None` if missing.
+        :rtype: xlref.engines.LazySheet
+        """
+        meta = self.read_meta(key)
+        info = meta and meta['sheets'].get(name)
+        if not info or 'extra' not in info:
+            return None
+        try:
+            path, mmap, blocks = self._path(key, info['id']), 'r', []
+            table = None
+            full_cells = np.load(path + '.full.npy', mmap_mode=mmap)
+            for i, (c0, c1, obj) in enumerate(info['blocks']):
+                fpath = '%s.%d.npy' % (path, i)
+                if obj == 'codes':
+                    if table is None and meta.get('strings'):
+                        table = self._load_strings(key)
+                    block = StringBlock(
+                        np.load(fpath, mmap_mode=mmap), table, np.load(
+                            '%s.%d.values.npy' % (path, i), allow_pickle=True
+                        )
+                    )
+                elif obj:
+                    block = np.load(fpath, allow_pickle=True)
+                else:
+                    block = np.load(fpath, mmap_mode=mmap)
+                blocks.append((c0, c1, block))
+            extra = None
+            if info['extra']:
+                extra = np.load(path + '.extra.npy', allow_pickle=True)
+                extra = extra[0].astype(int), extra[1].astype(int), extra[2]
+            os.utime(self._path(key, 'meta.json'))  # Mark recently used.
+        except (OSError, ValueError):
+            log.warning('Corrupted cache entry %s for %s.', key, name)
+            return None
+        margins = tuple(dict(m) for m in info['margins'])
+        values = Columns(blocks, info['shape'], extra)
+        return LazySheet(values=values, derived={
+            'full_cells': full_cells, 'margins': margins
+        })
+
+    def dump(self, key, name, sheet, meta):
+        """
+        Store a sheet into the cache.
+
+        :param key:
+            Cache key of the workbook.
+        :type key: str
+
+        :param name:
+            Lower sheet name.
+        :type name: str
+
+        :param sheet:
+            Sheet to be stored.
+        :type sheet: xlref.engines.LazySheet
+
+        :param meta:
+            Workbook metadata.
+        :type meta: dict
+        """
+        columns = sheet.columns
+        info = {
+            'id': uuid.uuid4().hex,  # Unique across concurrent writers.
+            'shape': list(columns.shape),
+            'blocks': [[c0, c1, self._kind(b, meta)]
+                       for c0, c1, b in columns.blocks],
+            'extra': int(columns.extra[0].shape[0]),
+            'margins': [{k: int(v) for k, v in m.items()}
+                        for m in sheet.margins]
+        }
+        path = self._path(key, info['id'])
+        self.write_meta(key, meta)
+        it = zip(info['blocks'], columns.blocks)
+        for i, ((_, _, kind), (_, _, block)) in enumerate(it):
+            fpath = '%s.%d' % (path, i)
+            if kind == 'codes':
+                if block.table is not None and not meta.get('strings'):
+                    self._dump_strings(key, block.table)
+                    meta['strings'] = True
+                np.save(fpath + '.values.npy', block.values, allow_pickle=True)
+                block = block.codes
+            np.save(fpath + '.npy', block, allow_pickle=kind is True)
+        if info['extra']:
+            np.save(path + '.extra.npy', np.array(columns.extra, object))
+        np.save(path + '.full.npy', sheet.full_cells)
+        meta['sheets'][name] = info
+        self.write_meta(key, meta)
+        self.evict(keep=key)
+
+    @staticmethod
+    def _kind(block, meta):
+        # Coded string blocks are stored as codes, other objects are pickled.
+        if isinstance(block, StringBlock) and (
+                block.table is None or isinstance(block.table, SharedStrings)
+        ):
+            return 'codes'
+        return bool(block.dtype == object)
+
+    def _dump_strings(self, key, table):
+        with open(self._path(key, 'strings.xml'), 'wb') as f:
+            f.write(table.data)
+        np.save(self._path(key, 'strings.npy'), table.offsets)
+
+    def _load_strings(self, key):
+        with open(self._path(key, 'strings.xml'), 'rb') as f:
+            data = f.read(0)
+            if os.fstat(f.fileno()).st_size:  # Mapped files stay valid.
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = np.load(self._path(key, 'strings.npy'), mmap_mode='r')
+        return SharedStrings(data, offsets)
+
+    def entries(self):
+        """
+        Return the cache entries sorted from the least recently used.
+
+        :return:
+            Cache keys.
+        :rtype: list[str]
+        """
+        it = []
+        for e in os.scandir(self.directory):
+            try:
+                it.append((os.stat(self._path(e.name, 'meta.json')).st_mtime,
+                           e.name))
+            except OSError:
+                continue
+        return [k for _, k in sorted(it)]
+
+    def remove(self, key):
+        shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def invalidate(self, fpath):
+        """
+        Remove all cache entries of a file.
+
+        :param fpath:
+            File path.
+        :type fpath: str
+        """
+        fpath = osp.abspath(fpath)
+        for key in self.entries():
+            if (self.read_meta(key) or {}).get('fpath') == fpath:
+                self.remove(key)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits into
+        `max_bytes`.
+
+        :param keep:
+            Cache key that must not be removed.
+        :type keep: str
+        """
+        if self.max_bytes is None:
+            return
+        sizes = {k: _dir_size(self._path(k)) for k in self.entries()}
+        total = sum(sizes.values())
+        for key, size in sizes.items():
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self.remove(key)
+                total -= size
+
+    def clear(self):
+        for key in self.entries():
+            self.remove(key)
+
+
+class StoredBook(Book):
+    """Workbook engine that reads and writes its sheets from a `DiskCache`."""
+
+    def __init__(self, book, store, key):
+        super(StoredBook, self).__init__(book.fpath, book.opener)
+        self.base, self.store, self.key = book, store, key
+
+    @property
+    def meta(self):
+        meta = self.store.read_meta(self.key)
+        if meta is None:
+            meta = {'fpath': osp.abspath(self.fpath), 'sheets': {}}
+        return meta
+
+    @property
+    def sheet_names(self):
+        meta = self.meta
+        if 'sheet_names' not in meta:
+            meta['sheet_names'] = list(self.base.sheet_names)
+            self.store.write_meta(self.key, meta)
+        return meta['sheet_names']
+
+    def iter_rows(self, name):
+        return self.base.iter_rows(name)
+
+    def parse(self, name):
+        return self.sheet(name).columns.grid()
+
+    def shape(self, name):
+        info = self.meta['sheets'].get(self._sheet_name(name).lower())
+        if info is None:
+            return self.base.shape(name)
+        return tuple(info['shape']) if 'shape' in info else None
+
+    def sheet(self, name):
+        name = self._sheet_name(name).lower()
+        sheet = self.store.load(self.key, name)
+        if sheet is None:
+            sheet = self.base.sheet(name)
+            self.store.dump(self.key, name, sheet, self.meta)
+        return sheet
+
+    def close(self):
+        self.base.close()
@@ -15,8 +15,6 @@ Define the command line interface.
 import click
 import logging
 import click_log
-import schedula as sh
-import xlref
 from xlref._version import __version__
 
 log = logging.getLogger('xlref.cli')
@@ -35,7 +33,6 @@ class _Logger(logging.Logger):
 
 logger = _Logger('cli')
 click_log.basic_config(logger)
-_process = sh.SubDispatch(xlref.dsp, ['written'], output_type='value')
 
 
 @click.group(
@@ -55,19 +52,97 @@ def cli():
     '-F', '--input-file', help='JSON xlref data excel references.',
     show_default=True, multiple=True
 )
+@click.option(
+    '-C', '--cache-dir', type=click.Path(file_okay=False),
+    help='Directory of the persistent cache of the parsed sheets.'
+)
+@click.option(
+    '-j', '--jobs', type=int, default=1, show_default=True,
+    help='Number of threads used to load the workbooks (0 uses all CPUs).'
+)
+@click.option(
+    '-P', '--processes', is_flag=True,
+    help='Load the workbooks with JOBS processes instead of threads.'
+)
+@click.option(
+    '-I', '--incremental', is_flag=True,
+    help='Re-read only the entries whose workbooks changed since the '
+         'previous OUTPUT_FILE (see OUTPUT_FILE.manifest.json).'
+)
+@click.option(
+    '--profile', is_flag=True,
+    help='Print the time and memory summary of the reading stages.'
+)
+@click.option(
+    '-S', '--server', metavar='ADDRESS',
+    help='Read with the `xlref serve` server at ADDRESS (socket path or '
+         'host:port).'
+)
 @click_log.simple_verbosity_option(logger)
-def read(output_file, input_file, input_reference):
+def read(output_file, input_file, input_reference, cache_dir, jobs,
+         processes, incremental, profile, server):
     """
     Read recursively the list of xlref data excel references.
 
-    OUTPUT_FILE: output file (format: .json).
+    OUTPUT_FILE: output file (format: .json, .npz, .parquet or .arrow).
 
     INPUT_REFERENCE: xlref data excel reference.
     """
-    return _process({
+    if server:
+        from xlref.server import read as read_server
+        try:
+            return read_server(server, output_file, input_reference,
+                               input_file)
+        except (OSError, RuntimeError) as ex:
+            raise click.ClickException(str(ex))
+    inputs = {
         'input_references': input_reference, 'input_fpaths': input_file,
-        'output_fpath': output_file
-    })
+        'output_fpath': output_file, 'jobs': jobs, 'processes': processes,
+        'stream': True, 'incremental': incremental
+    }
+    if cache_dir:
+        from xlref.cache import DiskCache
+        inputs['store'] = DiskCache(cache_dir)
+    from xlref.process import run
+    if not profile:
+        return run(**inputs)
+    from xlref.instrument import Collector
+    with Collector() as collector:
+        try:
+            return run(**inputs)
+        finally:
+            click.echo(collector.table(), err=True)
+
+
+@cli.command('serve', short_help='Serve xlref reads with a warm cache.')
+@click.argument('address', nargs=1)
+@click.option(
+    '-M', '--max-bytes', type=int,
+    help='Memory budget of the cache of the parsed sheets in bytes.'
+)
+@click.option(
+    '-C', '--cache-dir', type=click.Path(file_okay=False),
+    help='Directory of the persistent cache of the parsed sheets.'
+)
+@click_log.simple_verbosity_option(logger)
+def serve(address, max_bytes, cache_dir):
+    """
+    Serve the reads of xlref data excel references, keeping the parsed
+    workbooks in memory until their files change.
+
+    ADDRESS: Unix socket path or host:port (e.g., 127.0.0.1:8080).
+    """
+    from xlref.server import make_server
+    store = None
+    if cache_dir:
+        from xlref.cache import DiskCache
+        store = DiskCache(cache_dir)
+    with make_server(address, max_bytes, store) as server:
+        log.info('Serving on %s.', address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == '__main__':
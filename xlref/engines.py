@@ -0,0 +1,1404 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the workbook engines used by the reference parser to load sheets.
+"""
+import io
+import os
+import re
+import mmap
+import datetime
+import itertools
+import numpy as np
+from types import SimpleNamespace
+from .instrument import span
+
+#: Excel error codes that are read as empty cells.
+#:
+#: Unlike `pandas.read_excel`, the other `pandas` default missing values
+#: (e.g., `'NA'`, `'null'` or `'nan'`) are read as strings.
+ERROR_CODES = frozenset((
+    '#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'
+))
+
+
+def _cell(value):
+    cls = value.__class__
+    if cls is float:
+        if value.is_integer():  # Like `pandas.read_excel`.
+            return int(value)
+        return np.nan if value != value else value  # Dropped when trailing.
+    if value is None or (cls is str and (not value or value in ERROR_CODES)):
+        return np.nan
+    return value
+
+
+def _row(row):
+    row = [_cell(v) for v in row]
+    while row and row[-1] is np.nan:
+        row.pop()
+    return row
+
+
+def _stack(data, shape=None):
+    if shape is None:
+        n_rows = next((i for i in range(len(data), 0, -1) if data[i - 1]), 0)
+        shape = n_rows, max(map(len, data[:n_rows]), default=0)
+    grid = np.full(shape, np.nan, object)
+    for i, row in enumerate(data[:shape[0]]):
+        row = row[:shape[1]]
+        grid[i, :len(row)] = row
+    return grid
+
+
+def rows2grid(rows):
+    """
+    Stream the rows of a sheet into a compact object cell grid.
+
+    Empty cells are stored as `nan`, trailing empty rows and columns are
+    dropped.
+
+    :param rows:
+        Rows of cell values.
+    :type rows: collections.abc.Iterable[tuple]
+
+    :return:
+        Cell grid.
+    :rtype: numpy.ndarray
+    """
+    return _stack([_row(r) for r in rows])
+
+
+_DATETIME = np.dtype('datetime64[us]')
+
+
+def isnull(x):
+    """
+    Detect the empty values (`None`, `nan` and `NaT`), like `pandas.isnull`
+    but without importing pandas.
+
+    :param x:
+        Array or scalar.
+    :type x: numpy.ndarray | object
+
+    :return:
+        Mask of the empty values.
+    :rtype: numpy.ndarray | bool
+    """
+    if not isinstance(x, np.ndarray):
+        return x is None or bool(x != x)
+    kind = x.dtype.kind
+    if kind in 'fc':
+        return np.isnan(x)
+    if kind in 'mM':
+        return np.isnat(x)
+    if kind == 'O':
+        return ~np.equal(x, x).astype(bool) | np.equal(x, None).astype(bool)
+    return np.zeros(x.shape, bool)
+
+
+def notnull(x):
+    """
+    Detect the non-empty values (see :func:`isnull`).
+
+    :param x:
+        Array or scalar.
+    :type x: numpy.ndarray | object
+
+    :return:
+        Mask of the non-empty values.
+    :rtype: numpy.ndarray | bool
+    """
+    return ~isnull(x) if isinstance(x, np.ndarray) else not isnull(x)
+
+
+def _kind(cls):
+    if issubclass(cls, (bool, np.bool_)):
+        return 0
+    if issubclass(cls, (int, float, np.integer, np.floating)):
+        return 1
+    if issubclass(cls, datetime.datetime):
+        return 2
+    return 0
+
+
+def _split(col, full):
+    # Split a column into a typed array and its cells of other types.
+    types = list(map(type, col.tolist()))
+    kinds = {t: _kind(t) for t in set(types)}
+    if set(kinds.values()) == {1}:
+        return col.astype(float), None
+    codes = np.fromiter(map(kinds.__getitem__, types), np.int8, len(types))
+    n_num, n_dt = (full & (codes == 1)).sum(), (full & (codes == 2)).sum()
+    n_obj = full.sum() - n_num - n_dt
+    if n_dt > max(n_num, n_obj) and all(
+            v.tzinfo is None for v in col[codes == 2]):
+        typed = codes == 2
+        values = np.where(typed, col, None).astype(_DATETIME)
+    elif n_num >= n_obj:
+        typed = codes == 1
+        values = np.where(typed, col, np.nan).astype(float)
+    else:
+        return col, None
+    return values, np.flatnonzero(full & ~typed)
+
+
+def _object(block):
+    if block.dtype == object:
+        return block
+    grid = block.astype(object)
+    if block.dtype.kind == 'M':
+        grid[np.isnat(block)] = np.nan
+    elif block.dtype.kind == 'f':  # Integral numbers are read as `int`.
+        ints = np.isfinite(block) & (block == np.round(block))
+        small = ints & (np.abs(block) < 2.0 ** 63)  # Fit into `int64`.
+        grid[small] = block[small].astype(np.int64).astype(object)
+        large = ints & ~small
+        if large.any():  # Exact like `_cell`.
+            grid[large] = [int(v) for v in block[large].tolist()]
+    return grid
+
+
+_types = np.frompyfunc(type, 1, 1)
+
+
+def _readonly(array):
+    array = array.view()
+    array.flags.writeable = False
+    return array
+
+
+def _empty(shape):  # Read-only empty cells, without allocation.
+    return np.broadcast_to(np.float64(np.nan), shape)
+
+
+def _typed(grid):
+    if grid.dtype != object:
+        return grid
+    full = ~isnull(grid)
+    kinds = {_kind(t) for t in set(map(type, grid[full].tolist()))}
+    if kinds <= {1}:
+        return grid.astype(float)
+    if kinds == {2} and all(v.tzinfo is None for v in grid[full]):
+        return np.where(full, grid, None).astype(_DATETIME)
+    return grid
+
+
+class Columns:
+    """
+    Sheet cells stored in blocks of contiguous columns of the same type.
+
+    Numeric and datetime columns are stored as native `float64` and
+    `datetime64` arrays (empty cells are `nan` and `NaT`), while the columns
+    mostly made of other values are stored as `object` arrays. The few cells
+    of typed columns with a different type (e.g., headers) are stored apart.
+
+    :param blocks:
+        First column, last column (excluded) and array of each block.
+    :type blocks: list[tuple]
+
+    :param shape:
+        Number of rows and columns.
+    :type shape: tuple[int]
+
+    :param extra:
+        Rows, columns and values of the cells stored apart.
+    :type extra: tuple[numpy.ndarray]
+    """
+
+    def __init__(self, blocks, shape, extra=None):
+        self.blocks, self.shape = blocks, tuple(shape)
+        if extra is None:
+            extra = np.empty(0, int), np.empty(0, int), np.empty(0, object)
+        self.extra = extra
+
+    @classmethod
+    def from_grid(cls, grid):
+        """
+        Split a cell grid into typed blocks.
+
+        :param grid:
+            Cell grid (empty cells are `nan`).
+        :type grid: numpy.ndarray
+
+        :return:
+            Typed columns.
+        :rtype: Columns
+        """
+        n_rows, n_cols = grid.shape
+        if not n_cols:
+            return cls([], grid.shape)
+        if grid.dtype.kind in 'iuf':
+            grid = grid.astype(float, copy=False)
+            return cls([(0, n_cols, grid)], grid.shape)
+        if grid.dtype.kind == 'M':
+            grid = grid.astype(_DATETIME, copy=False)
+            return cls([(0, n_cols, grid)], grid.shape)
+        grid = grid.astype(object, copy=False)
+        full, columns, extra = notnull(grid), [], ([], [], [])
+        for j in range(n_cols):
+            values, rows = _split(grid[:, j], full[:, j])
+            columns.append(values)
+            if rows is not None and rows.shape[0]:
+                extra[0].append(rows)
+                extra[1].append(np.full(rows.shape, j))
+                extra[2].append(grid[rows, j])
+        if extra[0]:
+            extra = tuple(np.concatenate(v) for v in extra)
+        else:
+            extra = None
+        return cls.from_columns(columns, grid.shape, extra)
+
+    @classmethod
+    def from_columns(cls, columns, shape, extra=None):
+        """
+        Group the typed columns into blocks of contiguous columns.
+
+        :param columns:
+            Typed column arrays.
+        :type columns: list[numpy.ndarray]
+
+        :param shape:
+            Number of rows and columns.
+        :type shape: tuple[int]
+
+        :param extra:
+            Rows, columns and values of the cells stored apart.
+        :type extra: tuple[numpy.ndarray]
+
+        :return:
+            Typed columns.
+        :rtype: Columns
+        """
+        blocks, dtype = [], lambda j: columns[j].dtype
+        for _, it in itertools.groupby(range(len(columns)), dtype):
+            it = list(it)
+            block = np.stack(columns[it[0]:it[-1] + 1], 1)
+            blocks.append((it[0], it[-1] + 1, block))
+        return cls(blocks, shape, extra)
+
+    @property
+    def nbytes(self):
+        return sum(b.nbytes for _, _, b in self.blocks) + sum(
+            v.nbytes for v in self.extra
+        )
+
+    def full_cells(self):
+        """
+        Return the mask of the non-empty cells.
+
+        :return:
+            Mask of the non-empty cells.
+        :rtype: numpy.ndarray
+        """
+        full = np.zeros(self.shape, bool)
+        for c0, c1, b in self.blocks:
+            full[:, c0:c1] = b.full() if isinstance(b, StringBlock) else \
+                notnull(b)
+        full[self.extra[:2]] = True
+        return full
+
+    def grid(self):
+        """
+        Return the object cell grid.
+
+        :return:
+            Cell grid (empty cells are `nan`).
+        :rtype: numpy.ndarray
+        """
+        return self.band(0, self.shape[0], 0, self.shape[1], typed=False)
+
+    def band(self, r0, r1, c0, c1, typed=True):
+        """
+        Return the cells of a rectangle, typed if they are homogeneous.
+
+        :return:
+            Cell values.
+        :rtype: numpy.ndarray
+        """
+        shape = max(r1 - r0, 0), max(c1 - c0, 0)
+        rows = slice(max(r0, 0), max(r1, 0))
+        parts = [
+            (max(a, c0), min(b, c1), a, v) for a, b, v in self.blocks
+            if max(a, c0) < min(b, c1)
+        ] if rows.start < min(rows.stop, self.shape[0]) else []
+        er, ec, ev = self.extra
+        extra = (er >= r0) & (er < r1) & (ec >= c0) & (ec < c1)
+        if typed and not parts and not extra.any():
+            return _empty(shape)
+        if typed and len(parts) == 1 and parts[0][-1].dtype != object and \
+                not extra.any():
+            a, b, k, v = parts[0]
+            v = v[rows, a - k:b - k]
+            if v.dtype.kind == 'M' and np.isnat(v).all():  # No full cells.
+                return _empty(shape)
+            if v.shape == shape:
+                return _readonly(v)
+            empty = np.datetime64('NaT') if v.dtype.kind == 'M' else np.nan
+            out = np.full(shape, empty, v.dtype)
+        else:
+            out = np.full(shape, np.nan, object)
+        i = rows.start - r0
+        for a, b, k, v in parts:
+            v = v[rows, a - k:b - k]
+            if out.dtype == object:
+                v = _object(v)
+            out[i:i + v.shape[0], a - c0:b - c0] = v
+        out[er[extra] - r0, ec[extra] - c0] = ev[extra]
+        return _typed(out) if typed else out
+
+
+class StringBlock:
+    """
+    Block of `object` columns stored as cell codes, decoded when read.
+
+    Non-negative codes are indices of a shared table (e.g., the shared strings
+    of a workbook), `-1` marks the empty cells and the code `-2 - i` refers to
+    the `i`-th of the other values. Slices are decoded into `object` arrays.
+
+    :param codes:
+        Cell codes.
+    :type codes: numpy.ndarray
+
+    :param table:
+        Shared table, with a `take` method decoding an array of indices.
+    :type table: SharedStrings
+
+    :param values:
+        Other values.
+    :type values: numpy.ndarray
+    """
+    dtype = np.dtype(object)
+
+    def __init__(self, codes, table, values):
+        self.codes, self.table, self.values = codes, table, values
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        n = self.codes.nbytes + self.values.nbytes
+        return n + getattr(self.table, 'nbytes', 0)
+
+    def __getitem__(self, key):
+        codes = self.codes[key]
+        out = np.full(codes.shape, np.nan, object)
+        shared, other = codes >= 0, codes < -1
+        if shared.any():
+            out[shared] = self.table.take(codes[shared])
+        out[other] = self.values[-2 - codes[other]]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        grid = self[...]
+        return grid if dtype is None else grid.astype(dtype)
+
+    def full(self):
+        """
+        Return the mask of the non-empty cells, without decoding them.
+
+        :return:
+            Mask of the non-empty cells.
+        :rtype: numpy.ndarray
+        """
+        return self.codes != -1
+
+
+def _full_cells(sheet):
+    return sheet.columns.full_cells()
+
+
+def _values(sheet):
+    return _readonly(sheet.columns.grid())
+
+
+def _margins(sheet):
+    indices = np.array(np.where(sheet.full_cells)).T
+    if indices.shape[0]:
+        up_r, up_c = indices.min(0)
+        dn_r, dn_c = indices.max(0)
+    else:
+        up_r = up_c = dn_r = dn_c = 0
+    return {'^': up_r, '_': dn_r}, {'^': up_c, '_': dn_c}
+
+
+class LazySheet:
+    """
+    Sheet materialized on demand.
+
+    The rows are streamed from the engine only up to the last requested one,
+    while the typed columns are built only when they are explicitly required.
+    The structures derived from the full grid are shared by all references.
+
+    The `watchers` (e.g., caches) are called as `callback(sheet)` when the
+    sheet memory grows.
+    """
+
+    def __init__(self, rows=(), values=None, derived=None):
+        self._rows, self._data, self._columns = iter(rows), [], None
+        self._n_cells = 0  # Materialized cells of the streamed rows.
+        self.watchers = {}
+        if values is not None:
+            self._rows = self._data = None
+            if not isinstance(values, Columns):
+                values = Columns.from_grid(values)
+            self._columns = values
+        self.derived = {} if derived is None else derived
+
+    @property
+    def loaded(self):
+        """Whether the typed columns have been built."""
+        return self._columns is not None
+
+    def load(self, n_rows=None):
+        """
+        Materialize the sheet rows.
+
+        :param n_rows:
+            Minimum number of rows to materialize (`None` means all).
+        :type n_rows: int
+
+        :return:
+            Materialized rows.
+        :rtype: list[list]
+        """
+        data = self._data
+        if self._rows is not None:
+            n = None if n_rows is None else max(n_rows - len(data), 0)
+            k = len(data)
+            with span('sheet.load_rows') as s:
+                data.extend(map(_row, itertools.islice(self._rows, n)))
+                n_cells = sum(map(len, data[k:]))
+                s.update(shape=(len(data) - k, None),
+                         nbytes=n_cells * np.dtype(object).itemsize)
+            self._n_cells += n_cells
+            if n is None or len(data) - k < n:  # Rows are exhausted.
+                self._rows = None
+            self._grown()
+        return data
+
+    def _grown(self):
+        for callback in list(self.watchers.values()):
+            callback(self)
+
+    @property
+    def columns(self):
+        """Typed columns."""
+        if self._columns is None:
+            grid = _stack(self.load())
+            with span('sheet.columns') as s:
+                self._columns = Columns.from_grid(grid)
+                s.update(nbytes=self._columns.nbytes, shape=grid.shape)
+            self._data = None
+            self._grown()
+        return self._columns
+
+    @property
+    def values(self):
+        """Full cell grid (read-only), built once from the typed columns."""
+        return self.derive('values', _values)
+
+    def band(self, r0, r1, c0, c1):
+        """
+        Return the cells of a rectangle, loading only the needed rows.
+
+        Cells outside the sheet are filled with `nan`. The values are returned
+        as a `float64` or `datetime64` array when all full cells are numbers or
+        datetimes, otherwise as an `object` array. Values that are views of
+        the stored cells (or of a single empty cell) are read-only.
+
+        :param r0:
+            First row.
+        :type r0: int
+
+        :param r1:
+            Last row (excluded).
+        :type r1: int
+
+        :param c0:
+            First column.
+        :type c0: int
+
+        :param c1:
+            Last column (excluded).
+        :type c1: int
+
+        :return:
+            Cell values.
+        :rtype: numpy.ndarray
+        """
+        if self._columns is None:
+            shape = max(r1 - r0, 0), max(c1 - c0, 0)
+            return _typed(_stack([
+                r[c0:c1] for r in self.load(r1)[max(r0, 0):max(r1, 0)]
+            ], shape))
+        return self._columns.band(r0, r1, c0, c1)
+
+    def derive(self, key, func):
+        """
+        Return a structure derived from the sheet, computed only once.
+
+        :param key:
+            Name of the derived structure.
+        :type key: str
+
+        :param func:
+            Function that computes the structure from the sheet.
+        :type func: callable
+
+        :return:
+            Derived structure.
+        :rtype: object
+        """
+        if key not in self.derived:
+            self.derived[key] = func(self)
+            self._grown()
+        return self.derived[key]
+
+    @property
+    def full_cells(self):
+        """Mask of the non-empty cells."""
+        return self.derive('full_cells', _full_cells)
+
+    @property
+    def margins(self):
+        """Rows and columns margins (`^` first and `_` last) of full cells."""
+        return self.derive('margins', _margins)
+
+    @property
+    def derived_nbytes(self):
+        """Memory used by the derived structures."""
+        return sum(getattr(v, 'nbytes', 0) for v in self.derived.values())
+
+    @property
+    def nbytes(self):
+        """Memory used by the cells and the derived structures."""
+        if self._columns is None:
+            n = self._n_cells * np.dtype(object).itemsize
+        else:
+            n = self._columns.nbytes
+        return n + self.derived_nbytes
+
+
+class Book:
+    """Base workbook engine, the file is loaded on first use."""
+
+    def __init__(self, fpath, opener=open):
+        self.fpath, self.opener = fpath, opener
+        self._book = self._nbytes = None
+
+    @property
+    def nbytes(self):
+        """Estimated memory of the workbook (i.e., its file size)."""
+        if self._nbytes is None:
+            try:
+                self._nbytes = os.path.getsize(self.fpath)
+            except (OSError, TypeError):  # File not on disk.
+                self._nbytes = 0
+        return self._nbytes
+
+    @property
+    def book(self):
+        if self._book is None:
+            self._book = self._load()
+        return self._book
+
+    def _load(self):
+        raise NotImplementedError
+
+    @property
+    def sheet_names(self):
+        raise NotImplementedError
+
+    @property
+    def sheet_indices(self):
+        return {k.lower(): i for i, k in enumerate(self.sheet_names)}
+
+    def _sheet_name(self, name):
+        index = self.sheet_indices.get(name, name)
+        return self.sheet_names[index] if isinstance(index, int) else index
+
+    def iter_rows(self, name):
+        """
+        Iterate the rows of a sheet.
+
+        :param name:
+            Sheet name (case insensitive) or index.
+        :type name: str|int
+
+        :return:
+            Rows of cell values.
+        :rtype: collections.abc.Iterator[tuple]
+        """
+        yield from self.parse(name).tolist()
+
+    def parse(self, name):
+        """
+        Load a sheet as cell grid.
+
+        :param name:
+            Sheet name (case insensitive) or index.
+        :type name: str|int
+
+        :return:
+            Cell grid.
+        :rtype: numpy.ndarray
+        """
+        return rows2grid(self.iter_rows(name))
+
+    def sheet(self, name):
+        """
+        Open a sheet to be materialized on demand.
+
+        :param name:
+            Sheet name (case insensitive) or index.
+        :type name: str|int
+
+        :return:
+            Lazy sheet.
+        :rtype: LazySheet
+        """
+        return LazySheet(self.iter_rows(name))
+
+    def sheets(self, names):
+        """
+        Load several sheets at once.
+
+        :param names:
+            Sheet names (case insensitive) or indices.
+        :type names: list[str|int]
+
+        :return:
+            Fully materialized sheets by name.
+        :rtype: dict[str|int, LazySheet]
+        """
+        res = {}
+        for name in names:
+            res[name] = sheet = self.sheet(name)
+            sheet.columns
+        return res
+
+    def shape(self, name):
+        """
+        Return the sheet shape declared in the file, without loading it.
+
+        :param name:
+            Sheet name (case insensitive) or index.
+        :type name: str|int
+
+        :return:
+            Number of rows and columns (`None` if unknown).
+        :rtype: tuple[int]
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+class OpenpyxlBook(Book):
+    """
+    Native `openpyxl` engine.
+
+    The file is opened in read-only mode directly from its handle, so the sheet
+    rows are streamed into the cell grid without intermediate copies.
+    """
+
+    _file = None
+
+    def _source(self):
+        self._file = f = self.opener(self.fpath, 'rb')
+        if getattr(f, 'seekable', lambda: False)():
+            return f  # Zip members are read lazily from the file.
+        with f:
+            return io.BytesIO(f.read())
+
+    def _load(self):
+        from openpyxl import load_workbook
+        try:
+            return load_workbook(
+                self._source(), read_only=True, data_only=True,
+                keep_links=False
+            )
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def sheet_names(self):
+        return self.book.sheetnames
+
+    def iter_rows(self, name):
+        ws = self.book[self._sheet_name(name)]
+        ws.reset_dimensions()  # Dimensions stored in the file may be wrong.
+        return self._stream(ws.iter_rows(values_only=True))
+
+    def _stream(self, rows):  # The workbook is kept open while streamed.
+        yield from rows
+
+    def shape(self, name):
+        ws = self.book[self._sheet_name(name)]
+        if ws.max_row and ws.max_column:
+            return ws.max_row, ws.max_column
+
+    def close(self):
+        if self._book is not None:
+            self._book.close()
+            self._book = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __del__(self):  # Evicted workbooks release their file handle.
+        self.close()
+
+
+_SI = re.compile(rb'<(?:\w+:)?si[\s/>]')
+_SST_END = re.compile(rb'</(?:\w+:)?sst>')
+_TEXT = re.compile(
+    rb'<(?:\w+:)?rPh\b.*?</(?:\w+:)?rPh>|'  # Phonetic runs are skipped.
+    rb'<(?:\w+:)?t(?:\s[^>]*)?>(.*?)</(?:\w+:)?t>', re.S
+)
+_BLANK = re.compile(
+    rb'<(?:\w+:)?si\s*/>|<(?:\w+:)?si>\s*(?:<(?:\w+:)?t(?:\s[^>]*)?/>|'
+    rb'<(?:\w+:)?t(?:\s[^>]*)?>(?:%s)?</(?:\w+:)?t>)?\s*</(?:\w+:)?si>' %
+    b'|'.join(re.escape(v.encode()) for v in sorted(ERROR_CODES))
+)
+_ENTITY = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|[a-z]+);')
+_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+
+def _entity(match):
+    s = match.group(1)
+    if s[0] == '#':
+        return chr(int(s[2:], 16) if s[1] == 'x' else int(s[1:]))
+    return _ENTITIES[s]
+
+
+def _unescape(data):
+    # Character data as an XML parser returns it.
+    s = data.decode('utf-8')
+    if '\r' in s:
+        s = s.replace('\r\n', '\n').replace('\r', '\n')
+    if '&' in s:
+        s = _ENTITY.sub(_entity, s)
+    return s
+
+
+def _text(data):
+    # Text of a string item (plain or rich).
+    return _unescape(b''.join(_TEXT.findall(data)))
+
+
+class SharedStrings:
+    """
+    Shared strings table of a xlsx workbook, decoded on demand.
+
+    Only the offsets of the string items are indexed (on first use), while
+    each string is decoded when a cell that refers to it is read.
+
+    :param data:
+        Content of the shared strings part.
+    :type data: bytes
+
+    :param offsets:
+        Offsets of the string items (and of the end of the table), if known.
+    :type offsets: numpy.ndarray
+    """
+
+    def __init__(self, data, offsets=None):
+        self.data, self._strings = data, {}
+        self._offsets, self._blank = offsets, None
+
+    @property
+    def nbytes(self):
+        n = len(self.data)
+        return n if self._offsets is None else n + self._offsets.nbytes
+
+    @property
+    def decoded(self):
+        """Number of the decoded strings."""
+        return len(self._strings)
+
+    @property
+    def offsets(self):
+        """Offsets of the string items (and of the end of the table)."""
+        if self._offsets is None:
+            pos = np.fromiter(
+                (m.start() for m in _SI.finditer(self.data)), np.int64
+            )
+            end = _SST_END.search(self.data, int(pos[-1]) if pos.size else 0)
+            self._offsets = np.append(pos, end.start() if end else len(
+                self.data
+            ))
+        return self._offsets
+
+    @property
+    def blank(self):
+        """Indices of the strings read as empty cells (e.g., `''`)."""
+        if self._blank is None:
+            pos = np.fromiter(
+                (m.start() for m in _BLANK.finditer(self.data)), np.int64
+            )
+            self._blank = np.searchsorted(self.offsets, pos)
+        return self._blank
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, index):
+        s = self._strings.get(index)
+        if s is None:
+            i, j = self.offsets[index:index + 2].tolist()
+            s = _text(self.data[i:j]).replace('x005F_', '')
+            self._strings[index] = s
+        return s
+
+    def take(self, indices):
+        """
+        Decode the strings of an array of indices.
+
+        :param indices:
+            String indices.
+        :type indices: numpy.ndarray
+
+        :return:
+            Strings.
+        :rtype: numpy.ndarray
+        """
+        unique, inverse = np.unique(indices, return_inverse=True)
+        values = np.empty(unique.shape[0], object)
+        values[:] = [self[i] for i in unique.tolist()]
+        return values[inverse].reshape(indices.shape)
+
+
+class _Map(mmap.mmap):  # `zipfile` requires a seekable file.
+    def seekable(self):
+        return True
+
+
+_WORKSHEET = re.compile(rb'<(\w+:)?worksheet\b')
+_CELL = re.compile(
+    rb'<c r="([A-Z]+)([0-9]+)"(?:\s+(?:s="([0-9]+)"|t="(\w*)"|'
+    rb'[\w:]+="[^"]*"))*\s*(?:/>|>\s*(?:<f\b[^>]*?(?:/>|>[^<]*</f>)\s*)?'
+    rb'(?:<v(?:\s[^>]*)?>([^<]*)</v>)?(.*?)</c>)', re.S
+)
+#: Built-in number formats of dates and of durations.
+_DATE_FORMATS = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}, {46}
+_STRIP_FORMAT = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+_DATE_FORMAT = re.compile(r'(?<![_\\])[dmhysDMHYS]')
+_DURATION_FORMAT = re.compile(
+    r'\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?', re.I
+)
+_EPOCHS = np.datetime64('1899-12-30', 'us'), np.datetime64('1904-01-01', 'us')
+_DATE_RANGE = np.datetime64('0001-01-01', 'us'), np.datetime64(
+    '9999-12-31T23:59:59.999999', 'us'
+)
+
+
+def _col_index(letters):
+    n = 0
+    for c in letters:
+        n = n * 26 + c - 64
+    return n - 1
+
+
+def _is_date_format(fmt):
+    fmt = _STRIP_FORMAT.sub('', fmt.split(';')[0])
+    return _DATE_FORMAT.search(fmt) is not None
+
+
+def _is_duration_format(fmt):
+    return _DURATION_FORMAT.search(fmt.split(';')[0]) is not None
+
+
+def _excel_dates(serials, date1904):
+    # Dates of the serials as `openpyxl` converts them (`NaT` if not dates).
+    day, fraction = np.divmod(serials, 1)
+    ms = np.round(fraction * 86400 * 1000)
+    valid = np.abs(day) < 4e6
+    if not date1904:
+        day += (0 < serials) & (serials < 60)
+    day, ms = np.where(valid, day, 0), np.where(valid, ms, 0)
+    dates = _EPOCHS[date1904] + day.astype('timedelta64[D]') + \
+        ms.astype('timedelta64[ms]')
+    valid &= (_DATE_RANGE[0] <= dates) & (dates <= _DATE_RANGE[1])
+    valid &= ~((0 <= serials) & (serials < 1) & (ms < 86400000))  # Times.
+    return np.where(valid, dates, np.datetime64('NaT'))
+
+
+def _excel_time(serial, duration):
+    # Time or duration of a serial as `openpyxl` converts it.
+    try:
+        if duration:
+            td = datetime.timedelta(days=serial)
+            if td.microseconds:
+                td = datetime.timedelta(
+                    seconds=td.total_seconds() // 1,
+                    microseconds=round(td.microseconds, -3)
+                )
+            return td
+        diff = datetime.timedelta(milliseconds=round(serial * 86400 * 1000))
+        mins, seconds = divmod(diff.seconds, 60)
+        hours, mins = divmod(mins, 60)
+        return datetime.time(hours, mins, seconds, diff.microseconds)
+    except (OverflowError, ValueError):
+        return None
+
+
+def _value(dtype, value, inline):
+    # Value of a cell that is neither a number nor a shared string.
+    if dtype == b'b':
+        return bool(int(value))
+    if dtype == b'e':
+        return None
+    if dtype == b'd':
+        from openpyxl.utils.datetime import from_ISO8601
+        return from_ISO8601(value.decode())
+    s = _text(inline) if dtype == b'inlineStr' else _unescape(value)
+    return None if not s or s in ERROR_CODES else s
+
+
+def _assemble(rows, cols, kinds, nums, dates, codes, others, table):
+    # Typed columns (split like `Columns.from_grid`) and full cells.
+    i = np.flatnonzero(kinds >= 0)
+    i = i[np.argsort(cols[i], kind='stable')]
+    rows, cols, kinds = rows[i], cols[i], kinds[i]
+    nums, dates, codes = nums[i], dates[i], codes[i]
+    if not i.size:
+        return Columns([], (0, 0)), np.zeros((0, 0), bool)
+    shape = int(rows.max()) + 1, int(cols[-1]) + 1
+    full = np.zeros(shape, bool)
+    full[rows, cols] = True
+    n_num = np.bincount(cols[kinds == 0], minlength=shape[1])
+    n_dt = np.bincount(cols[kinds == 1], minlength=shape[1])
+    n_obj = np.bincount(cols, minlength=shape[1]) - n_num - n_dt
+    kind = np.where(n_dt > np.maximum(n_num, n_obj), 1, np.where(
+        n_num >= n_obj, 0, 4
+    ))
+    bounds = np.searchsorted(cols, np.arange(shape[1] + 1))
+    blocks, coded, extra = [], [], []
+    for k, it in itertools.groupby(range(shape[1]), kind.__getitem__):
+        it = list(it)
+        a, b = it[0], it[-1] + 1
+        s = slice(bounds[a], bounds[b])
+        r, c, kk = rows[s], cols[s] - a, kinds[s]
+        if k == 0:
+            block, typed = np.full((shape[0], b - a), np.nan), kk == 0
+            block[r[typed], c[typed]] = nums[s][typed]
+        elif k == 1:
+            block = np.full((shape[0], b - a), np.datetime64('NaT'), _DATETIME)
+            typed = kk == 1
+            block[r[typed], c[typed]] = dates[s][typed]
+        else:  # Numbers and dates are stored as other values.
+            block, typed = np.full((shape[0], b - a), -1, np.int32), kk >= 0
+            code = codes[s].copy()
+            for m, v in ((kk == 0, nums[s]), (kk == 1, dates[s])):
+                code[m] = len(others) + np.arange(m.sum())
+                others.extend(_object(v[m]).tolist())
+            block[r, c] = np.where(kk == 3, code, -2 - code)
+            coded.append(len(blocks))
+        blocks.append((a, b, block))
+        extra.append(s.start + np.flatnonzero(~typed))
+    values = np.empty(len(others), object)
+    values[:] = others
+    for j in coded:
+        a, b, block = blocks[j]
+        blocks[j] = a, b, StringBlock(block, table, values)
+    i = np.concatenate(extra)
+    if i.size:
+        kk, ev = kinds[i], np.empty(i.shape, object)
+        ev[kk == 0] = _object(nums[i][kk == 0])
+        ev[kk == 1] = dates[i][kk == 1].astype(object)
+        if (kk == 3).any():
+            ev[kk == 3] = table.take(codes[i][kk == 3])
+        ev[kk == 4] = values[codes[i][kk == 4]]
+        extra = rows[i], cols[i], ev
+    else:
+        extra = None
+    return Columns(blocks, shape, extra), full
+
+
+class XlsxBook(Book):
+    """
+    Native xlsx engine, reading the zip members from a memory map of the file.
+
+    The worksheet XML is scanned in chunks straight into typed columns, and
+    the `full_cells` mask is built from the cells holding a value. The shared
+    strings are only indexed: a string is decoded when a cell referring to it
+    is read (see :class:`SharedStrings`), so the string columns do not slow
+    down the references to the numeric ones.
+
+    Sheets are loaded entirely on first use (use :class:`OpenpyxlBook` to
+    stream only the requested rows), those with a layout the scanner does not
+    handle (e.g., namespace prefixes) are read with :class:`OpenpyxlBook`.
+    The engine is enabled with `ENGINES['xlsx'] = XlsxBook` (or per `Ref`
+    subclass, overriding `_engines`).
+    """
+    #: Size of the chunks of worksheet XML scanned at once [bytes].
+    chunk_size = 1 << 22
+
+    def __init__(self, fpath, opener=open):
+        super(XlsxBook, self).__init__(fpath, opener)
+        self._map = self._strings = self._fallback = None
+
+    def _source(self):
+        with self.opener(self.fpath, 'rb') as f:
+            try:
+                return _Map(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (AttributeError, OSError, ValueError):
+                return io.BytesIO(f.read())
+
+    def _load(self):
+        import zipfile
+        import posixpath
+        import xml.etree.ElementTree as ET
+
+        def rels(path):
+            d, name = posixpath.split(path)
+            path = posixpath.join(d, '_rels', name + '.rels')
+            res, root = {}, ET.fromstring(zf.read(path))
+            for e in root.iterfind('{*}Relationship'):
+                target = e.get('Target')
+                if target.startswith('/'):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(d, target))
+                res[e.get('Id')] = e.get('Type').rsplit('/', 1)[-1], target
+            return res
+
+        self._map = self._source()
+        zf = zipfile.ZipFile(self._map)
+        path = next(
+            v for k, v in rels('').values() if k == 'officeDocument'
+        )
+        parts, root = rels(path), ET.fromstring(zf.read(path))
+        sheets = {}
+        for e in root.iterfind('{*}sheets/{*}sheet'):
+            rid = next(v for k, v in e.attrib.items() if k.endswith('}id'))
+            sheets[e.get('name')] = parts.get(rid, (None, None))[1]
+        pr = root.find('{*}workbookPr')
+        date1904 = pr is not None and pr.get('date1904') in ('1', 'true')
+        parts = {k: v for k, v in parts.values()}
+        dates, durations = [], []
+        if 'styles' in parts:
+            root = ET.fromstring(zf.read(parts['styles']))
+            custom = {
+                int(e.get('numFmtId')): e.get('formatCode') for e in
+                root.iterfind('{*}numFmts/{*}numFmt')
+            }
+            for i, e in enumerate(root.iterfind('{*}cellXfs/{*}xf')):
+                k = int(e.get('numFmtId', 0))
+                if k in custom:
+                    fmt = custom[k]
+                    if _is_date_format(fmt):
+                        dates.append(i)
+                    if _is_duration_format(fmt):
+                        durations.append(i)
+                else:
+                    if k in _DATE_FORMATS[0]:
+                        dates.append(i)
+                    if k in _DATE_FORMATS[1]:
+                        durations.append(i)
+        return SimpleNamespace(
+            zip=zf, sheets=sheets, strings=parts.get('sharedStrings'),
+            date1904=date1904, dates=np.array(dates, int),
+            durations=np.array(durations, int)
+        )
+
+    @property
+    def sheet_names(self):
+        return list(self.book.sheets)
+
+    @property
+    def strings(self):
+        """Shared strings table (`None` if missing)."""
+        if self._strings is None and self.book.strings:
+            self._strings = SharedStrings(self.book.zip.read(
+                self.book.strings
+            ))
+        return self._strings
+
+    def _chunks(self, path):
+        # Cells of the worksheet, per chunk (`None` if not supported).
+        buf = b''
+        with self.book.zip.open(path) as f:
+            data = f.read(self.chunk_size)
+            match = _WORKSHEET.search(data)
+            if match is None or match.group(1):
+                yield None
+                return
+            while True:
+                buf += data
+                i = buf.rfind(b'</row>') + 6 if data else len(buf)
+                if i >= 6:
+                    found = _CELL.findall(buf, 0, i)
+                    if len(found) != sum(buf.count(k, 0, i) for k in (
+                            b'<c ', b'<c>', b'<c/>')):  # E.g., no `r`.
+                        yield None
+                        return
+                    buf = buf[i:]
+                    if found:
+                        yield found
+                if not data:
+                    break
+                data = f.read(self.chunk_size)
+
+    def _cells(self, found, others):
+        # Rows, columns, kinds, numbers and codes of a chunk of cells.
+        # Kinds: -1 empty, 0 number, 1 date, 2 duration, 3 shared string and
+        # 4 other value (index of `others`).
+        cols, rows, styles, dtypes, values, inline = zip(*found)
+        n, compress = len(found), itertools.compress
+        index = {k: _col_index(k) for k in set(cols)}
+        cols = np.fromiter(map(index.__getitem__, cols), np.int64, n)
+        index = {k: int(k) - 1 for k in set(rows)}
+        rows = np.fromiter(map(index.__getitem__, rows), np.int64, n)
+        dtypes = np.array(dtypes)
+        full = np.fromiter(map(bool, values), bool, n)
+        kinds, nums = np.full(n, -1, np.int8), np.zeros(n)
+        codes = np.zeros(n, np.int64)
+        num = full & ((dtypes == b'') | (dtypes == b'n'))
+        nums[num] = np.array(list(compress(values, num)), object).astype(float)
+        kinds[num] = 0
+        book = self.book
+        if book.dates.size and num.any():
+            styles = np.array(styles)
+            styles = np.where(styles == b'', b'0', styles).astype(int)
+            kinds[num & np.isin(styles, book.dates)] = 1
+            kinds[num & np.isin(styles, book.durations)] = 2
+        shared = full & (dtypes == b's')
+        codes[shared] = np.array(
+            list(compress(values, shared)), object
+        ).astype(np.int64)
+        kinds[shared] = 3
+        for i in np.flatnonzero(~(num | shared) & (full | (
+                dtypes == b'inlineStr'))).tolist():
+            v = _value(dtypes[i], values[i], inline[i])
+            if v is not None:
+                codes[i], kinds[i] = len(others), 4
+                others.append(v)
+        return rows, cols, kinds, nums, codes
+
+    def _columns(self, path):
+        # Typed columns and full cells of a worksheet (`None` if unsupported).
+        others, chunks = [], []
+        for found in self._chunks(path):
+            cells = found and self._cells(found, others)
+            if cells is None:
+                return None
+            chunks.append(cells)
+        if not chunks:
+            return Columns([], (0, 0)), np.zeros((0, 0), bool)
+        rows, cols, kinds, nums, codes = map(np.concatenate, zip(*chunks))
+        dates = np.full(rows.shape, np.datetime64('NaT'), _DATETIME)
+        i = np.flatnonzero(kinds == 1)
+        dates[i] = _excel_dates(nums[i], self.book.date1904)
+        for j in i[np.isnat(dates[i])].tolist() + np.flatnonzero(
+                kinds == 2).tolist():  # Times, durations and invalid dates.
+            duration = kinds[j] == 2
+            v = _excel_time(nums[j], duration) if duration or \
+                0 <= nums[j] < 1 else None
+            kinds[j] = -1 if v is None else 4
+            if v is not None:
+                codes[j] = len(others)
+                others.append(v)
+        table = self.strings
+        if table is not None and table.blank.size:
+            kinds[(kinds == 3) & np.isin(codes, table.blank)] = -1
+        return _assemble(rows, cols, kinds, nums, dates, codes, others, table)
+
+    def sheet(self, name):
+        name = self._sheet_name(name)
+        with span('sheet.columns', file=self.fpath, sheet=name) as s:
+            res = self._columns(self.book.sheets[name])
+            if res is not None:
+                s.update(nbytes=res[0].nbytes, shape=res[0].shape)
+        if res is None:
+            if self._fallback is None:
+                self._fallback = OpenpyxlBook(self.fpath, self.opener)
+            return self._fallback.sheet(name)
+        return LazySheet(values=res[0], derived={'full_cells': res[1]})
+
+    def parse(self, name):
+        return self.sheet(name).columns.grid()
+
+    def shape(self, name):
+        with self.book.zip.open(self.book.sheets[self._sheet_name(name)]) as f:
+            match = re.search(
+                rb'<dimension ref="(?:[A-Z]+[0-9]+:)?([A-Z]+)([0-9]+)"',
+                f.read(1 << 16)
+            )
+        if match:
+            return int(match.group(2)), _col_index(match.group(1)) + 1
+
+    def close(self):
+        if self._fallback is not None:
+            self._fallback.close()
+            self._fallback = None
+        if self._book is not None:
+            self._book.zip.close()
+            self._book = None
+            self._map.close()
+
+
+class PandasBook(Book):
+    """Engine based on `pandas.ExcelFile`."""
+    engine = None
+    parse_kw = {'header': None}
+
+    def _load(self):
+        from pandas import ExcelFile
+        with self.opener(self.fpath, 'rb') as f:
+            return ExcelFile(io.BytesIO(f.read()), engine=self.engine)
+
+    @property
+    def sheet_names(self):
+        return self.book.sheet_names
+
+    def parse(self, name):
+        return self.book.parse(self._sheet_name(name), **self.parse_kw).values
+
+    def sheet(self, name):
+        return LazySheet(values=self.parse(name))
+
+    def sheets(self, names):
+        data = self.book.parse(
+            [self._sheet_name(k) for k in names], **self.parse_kw
+        )  # Parse all sheets in a single call.
+        return {
+            k: LazySheet(values=data[self._sheet_name(k)].values)
+            for k in names
+        }
+
+    def close(self):
+        if self._book is not None:
+            self._book.close()
+            self._book = None
+
+
+class XlrdBook(PandasBook):
+    engine = 'xlrd'
+
+
+class OdfBook(PandasBook):
+    engine = 'odf'
+
+
+class PyxlsbBook(PandasBook):
+    engine = 'pyxlsb'
+
+
+class CsvBook(Book):
+    """
+    Engine for delimited text files, with a single sheet.
+
+    By default the whole file is parsed at once into typed column blocks, and
+    the `full_cells` mask is built while parsing. If `chunksize` is set, the
+    rows are parsed in chunks only up to the last requested one, and the
+    types are inferred per chunk. In both modes the cells are normalized as
+    the rows of the other engines (e.g., integral numbers are `int`, error
+    codes are empty cells and trailing empty rows are dropped).
+    """
+    sheet_names = ['sheet1']
+    #: Field delimiter.
+    delimiter = ','
+    #: Parser engine of `pandas.read_csv` (e.g., `'c'` or `'pyarrow'`).
+    parser = 'c'
+    #: Maximum number of rows to be read (`None` means all).
+    nrows = None
+    #: Number of rows parsed per chunk (`None` parses the whole file).
+    chunksize = None
+
+    def __init__(self, fpath, opener=open):
+        super(CsvBook, self).__init__(fpath, opener)
+        if self.chunksize is not None and self.parser == 'pyarrow':
+            raise ValueError(
+                "The 'pyarrow' parser does not support the `chunksize`."
+            )
+
+    def _read(self, f, **kw):
+        from pandas import read_csv
+        return read_csv(
+            f, header=None, sep=self.delimiter, engine=self.parser,
+            nrows=self.nrows, na_values=ERROR_CODES, **kw
+        )
+
+    def iter_rows(self, name):
+        if self.chunksize is None:
+            yield from super(CsvBook, self).iter_rows(name)
+            return
+        with self.opener(self.fpath, 'rb') as f:
+            with self._read(f, chunksize=self.chunksize) as reader:
+                for chunk in reader:
+                    yield from chunk.values.tolist()
+
+    def _sheet(self):
+        # Typed blocks built per column, normalized like the streamed rows.
+        from pandas.api.types import infer_dtype
+        with self.opener(self.fpath, 'rb') as f:
+            frame = self._read(f)
+        full = frame.notna().values
+        rows, cols = full.any(1).nonzero()[0], full.any(0).nonzero()[0]
+        n_rows = int(rows[-1]) + 1 if rows.size else 0
+        shape = n_rows, int(cols[-1]) + 1 if cols.size else 0
+        full, columns, extra = full[:shape[0], :shape[1]], [], ([], [], [])
+        for j in range(shape[1]):
+            col = frame.iloc[:shape[0], j]
+            if col.dtype.kind in 'iuf':
+                columns.append(col.to_numpy(float, na_value=np.nan))
+                continue
+            cells = col.to_numpy(object, copy=True)
+            cells[~full[:, j]] = np.nan
+            if infer_dtype(cells, skipna=True) in ('string', 'empty'):
+                columns.append(cells)
+                continue
+            values, index = _split(cells, full[:, j])
+            if values.dtype == object:  # Integral numbers are `int`.
+                floats = _types(values) == float
+                values[floats] = _object(values[floats].astype(float))
+            columns.append(values)
+            if index is not None and index.shape[0]:
+                extra[0].append(index)
+                extra[1].append(np.full(index.shape, j))
+                extra[2].append(cells[index])  # Not numbers.
+        extra = tuple(map(np.concatenate, extra)) if extra[0] else None
+        return LazySheet(values=Columns.from_columns(
+            columns, shape, extra
+        ), derived={'full_cells': full})
+
+    def parse(self, name):
+        return self.sheet(name).columns.grid()
+
+    def sheet(self, name):
+        if self.chunksize is not None:
+            return LazySheet(self.iter_rows(name))
+        return self._sheet()
+
+
+class TsvBook(CsvBook):
+    """Engine for tab separated values files, with a single sheet."""
+    delimiter = '\t'
+
+
+#: Registry of workbook engines by file extension (`None` is the default).
+ENGINES = {
+    'xlsx': OpenpyxlBook,
+    'xlsxm': OpenpyxlBook,
+    'xlsm': OpenpyxlBook,
+    'xls': XlrdBook,
+    'odf': OdfBook,
+    'ods': OdfBook,
+    'odt': OdfBook,
+    'csv': CsvBook,
+    'tsv': TsvBook,
+    'xlsb': PyxlsbBook,
+    None: OpenpyxlBook
+}
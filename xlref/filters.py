@@ -9,17 +9,85 @@
 """
 It provides functions implementations to filter the parsed data.
 """
+import copy
 import numpy as np
-import schedula as sh
+from .engines import isnull, notnull
 from .errors import InvalidReference, NoFullCell
 
 
+#: Array methods that modify the array in place.
+MUTATING_METHODS = frozenset((
+    'byteswap', 'fill', 'itemset', 'partition', 'put', 'resize', 'setfield',
+    'setflags', 'sort'
+))
+
+
+def mutates(func):
+    """
+    Declare that a filter modifies its input in place.
+
+    Read-only inputs (e.g., views of the cached sheets) are copied before
+    calling the filter.
+
+    :param func:
+        Filter function.
+    :type func: callable
+
+    :return:
+        Filter function.
+    :rtype: callable
+    """
+    func.mutates = True
+    return func
+
+
+def writable(x):
+    """
+    Return a writable copy of the input if it is or contains read-only arrays.
+
+    Dicts, lists, tuples, and object arrays are copied recursively only when
+    some of their items are copied.
+
+    :param x:
+        Input value.
+    :type x: object
+
+    :return:
+        Writable value.
+    :rtype: object
+    """
+    if isinstance(x, np.ndarray):
+        if x.dtype == object:
+            items = x.ravel().tolist()
+            copied = [writable(v) for v in items]
+            if any(a is not b for a, b in zip(copied, items)):
+                y = np.empty(len(copied), object)
+                for i, v in enumerate(copied):
+                    y[i] = v
+                return y.reshape(x.shape)
+        return x if x.flags.writeable else np.array(x)
+    if isinstance(x, dict):
+        copied = {k: writable(v) for k, v in x.items()}
+        if any(copied[k] is not v for k, v in x.items()):
+            return copied
+    elif isinstance(x, (list, tuple)):
+        copied = [writable(v) for v in x]
+        if any(a is not b for a, b in zip(copied, x)):
+            if isinstance(x, list):
+                return copied
+            return type(x)(*copied) if hasattr(x, '_fields') else tuple(copied)
+    return x
+
+
 class FiltersFactory(dict):
     def __getitem__(self, item):
         try:
             return super(FiltersFactory, self).__getitem__(item)
         except KeyError:
-            return lambda p, x, *args, **kw: getattr(x, item)(*args, **kw)
+            def method(p, x, *args, **kw):
+                return getattr(x, item)(*args, **kw)
+
+            return mutates(method) if item in MUTATING_METHODS else method
 
 
 FILTERS = FiltersFactory({
@@ -45,7 +113,6 @@ def full(parent, x):
         Filtered array.
     :rtype: list
     """
-    from pandas import notnull
     return [list(filter(notnull, r)) for r in x]
 
 
@@ -82,10 +149,22 @@ def ref(parent, x):
 FILTERS['ref'] = ref
 
 
+def _sheet_key(x):
+    from .parser import parse_reference
+    try:
+        c = parse_reference(x)
+    except (InvalidReference, TypeError):
+        return '', ''
+    return c.file or '', (c.sheet or '').lower()
+
+
 def recursive(parent, x, dtype=None):
     """
     Parse recursively all values in the array.
 
+    Each distinct reference is resolved once and its values are copied into
+    the other cells with the same reference.
+
     :param parent:
         Parent parser.
     :type parent: xlref.parser.Ref
@@ -98,7 +177,23 @@ def recursive(parent, x, dtype=None):
         Parsed array.
     :rtype: numpy.array
     """
-    res, shape = [ref(parent, v) for v in np.ravel(x)], np.shape(x)
+    flat, shape = np.ravel(x), np.shape(x)
+    res = list(flat)
+    if flat.dtype.kind == 'U':
+        index = np.flatnonzero(np.char.find(flat, '#') >= 0)
+    elif flat.dtype.kind == 'O':
+        index = [
+            i for i, v in enumerate(res) if isinstance(v, str) and '#' in v
+        ]
+    else:  # Only strings can be references.
+        index = ()
+    refs = {}  # Resolve once each reference, grouped by target sheet.
+    for i in index:
+        refs.setdefault(res[i], []).append(i)
+    for k in sorted(refs, key=_sheet_key):
+        v = ref(parent, k)
+        for n, i in enumerate(refs[k]):  # The cells do not share values.
+            res[i] = copy.deepcopy(v) if n else v
     if dtype is None and isinstance(x, np.ndarray):
         dtype = x.dtype
     return np.reshape(np.asarray(res, dtype=dtype), shape)
@@ -115,6 +210,10 @@ def _kv(it):
             yield k, v
 
 
+def _stlp(s):
+    return [s] if isinstance(s, str) else s
+
+
 def fdict(parent, x, key=None, value=None):
     """
     Convert the input array into a dictionary.
@@ -139,12 +238,11 @@ def fdict(parent, x, key=None, value=None):
         Parsed dictionary.
     :rtype: dict
     """
-    from pandas import isnull
     from .parser import compile_filters
     x = x.items() if isinstance(x, dict) else x
     it = ((v[0], v[1] if len(v) == 2 else v[1:]) for v in x if not isnull(v[0]))
-    key = key and compile_filters(sh.stlp(key), parent) or (lambda k: k)
-    value = value and compile_filters(sh.stlp(value), parent) or (lambda v: v)
+    key = key and compile_filters(_stlp(key), parent) or (lambda k: k)
+    value = value and compile_filters(_stlp(value), parent) or (lambda v: v)
     return dict(_kv((key(k), value(v)) for k, v in _kv(it)))
 
 
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the opt-in timing and memory instrumentation of the references.
+
+The stages (e.g., `'ref.book'`, `'ref.values'`, `'filter.dict'`,
+`'process.read_references'`) and the cache lookups (`'cache'`) are reported
+to the callbacks installed with :func:`instrument` as
+`callback(stage, seconds, info)`, where `info` is a dict that may contain the
+`file`, `sheet`, `nbytes`, `shape` and `hit` of the stage. Nothing is
+measured when no callback is installed.
+
+The stage times include their nested stages. The iterators returned by the
+timed functions (e.g., `process.read_references` when streaming) are timed
+while they are consumed, hence a streamed `process.write_output` includes the
+reading of the references that it writes.
+
+Example::
+
+    >>> import xlref as xl
+    >>> from xlref.instrument import Collector
+    >>> with Collector() as c:
+    ...     values = xl.Ref('tests/files/excel.xlsx#ref!A1(RD):RD').values
+    >>> print(c.table())  # doctest: +SKIP
+"""
+import time
+import functools
+import contextlib
+import contextvars
+import collections.abc
+
+_callbacks = contextvars.ContextVar('callbacks', default=())
+
+
+class _Span:
+    __slots__ = 'stage', 'info', 'callbacks', 'start'
+
+    def __init__(self, stage, info, callbacks):
+        self.stage, self.info, self.callbacks = stage, info, callbacks
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.report(time.perf_counter() - self.start)
+
+    def update(self, **info):
+        self.info.update(info)
+
+    def report(self, seconds):
+        for callback in self.callbacks:
+            callback(self.stage, seconds, self.info)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def update(self, **info):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+def enabled():
+    """
+    Return if any callback is installed.
+
+    :return:
+        Instrumentation status.
+    :rtype: bool
+    """
+    return bool(_callbacks.get())
+
+
+def span(stage, **info):
+    """
+    Measure the wall time of a stage (used as context manager).
+
+    :param stage:
+        Stage name.
+    :type stage: str
+
+    :return:
+        Context manager, whose `update` method adds info to the stage.
+    """
+    callbacks = _callbacks.get()
+    return _Span(stage, info, callbacks) if callbacks else _NULL
+
+
+def event(stage, **info):
+    """
+    Report an instantaneous event (e.g., a cache lookup).
+
+    :param stage:
+        Stage name.
+    :type stage: str
+    """
+    for callback in _callbacks.get():
+        callback(stage, 0.0, info)
+
+
+def _consume(span, iterator, seconds):
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            yield item
+    finally:  # Reported once, when exhausted or closed.
+        span.report(seconds)
+
+
+def timed_iter(stage, iterable, **info):
+    """
+    Measure the wall time spent consuming an iterable.
+
+    :param stage:
+        Stage name.
+    :type stage: str
+
+    :param iterable:
+        Iterable to be timed.
+    :type iterable: collections.abc.Iterable
+
+    :return:
+        Iterator, reporting the stage when it is exhausted or closed.
+    :rtype: collections.abc.Iterator
+    """
+    callbacks = _callbacks.get()
+    if not callbacks:
+        return iter(iterable)
+    return _consume(_Span(stage, info, callbacks), iter(iterable), 0.0)
+
+
+def timed(stage):
+    """
+    Decorator that measures the wall time of each function call.
+
+    When the function returns an iterator, its consumption is timed as well
+    (see :func:`timed_iter`).
+
+    :param stage:
+        Stage name.
+    :type stage: str
+
+    :return:
+        Decorator.
+    :rtype: callable
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            callbacks = _callbacks.get()
+            if not callbacks:
+                return func(*args, **kwargs)
+            span, start = _Span(stage, {}, callbacks), time.perf_counter()
+            try:
+                res = func(*args, **kwargs)
+            except BaseException:
+                span.report(time.perf_counter() - start)
+                raise
+            if isinstance(res, collections.abc.Iterator):
+                return _consume(span, res, time.perf_counter() - start)
+            span.report(time.perf_counter() - start)
+            return res
+
+        return wrapper
+
+    return decorator
+
+
+def in_context(func):
+    """
+    Return a function that calls `func` in a copy of the current context, so
+    that the workers of a thread pool report to the installed callbacks.
+
+    :param func:
+        Function to be called by the workers.
+    :type func: callable
+
+    :return:
+        Function of the pool workers.
+    :rtype: callable
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):  # A context is entered by a thread at once.
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def instrument(callback):
+    """
+    Install a callback for the stages run within the context.
+
+    :param callback:
+        Function called as `callback(stage, seconds, info)`.
+    :type callback: callable
+    """
+    token = _callbacks.set(_callbacks.get() + (callback,))
+    try:
+        yield callback
+    finally:
+        _callbacks.reset(token)
+
+
+class Collector:
+    """
+    Callback that aggregates the stages and cache lookups (used as context
+    manager).
+    """
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self.lookups = collections.OrderedDict()
+        self._context = None
+
+    def __call__(self, stage, seconds, info):
+        if stage == 'cache':
+            key = info.get('file'), info.get('sheet')
+            hits = self.lookups.setdefault(key, [0, 0])
+            hits[not info.get('hit')] += 1
+            return
+        s = self.stages.get(stage)
+        if s is None:
+            self.stages[stage] = s = {
+                'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'nbytes': 0
+            }
+        s['calls'] += 1
+        s['seconds'] += seconds
+        s['max_seconds'] = max(s['max_seconds'], seconds)
+        s['nbytes'] += info.get('nbytes') or 0
+
+    def __enter__(self):
+        self._context = instrument(self)
+        self._context.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._context.__exit__(*exc)
+
+    def table(self):
+        """
+        Return the summary table of the stages and cache lookups.
+
+        :return:
+            Summary table.
+        :rtype: str
+        """
+        lines = ['%-32s %8s %12s %12s %14s' % (
+            'stage', 'calls', 'total [s]', 'max [s]', 'bytes'
+        )]
+        for k, s in sorted(self.stages.items(), key=lambda x: -x[1][
+            'seconds'
+        ]):
+            lines.append('%-32s %8d %12.6f %12.6f %14d' % (
+                k, s['calls'], s['seconds'], s['max_seconds'], s['nbytes']
+            ))
+        if self.lookups:
+            lines.extend(('', '%-50s %8s %8s' % ('cache', 'hits', 'misses')))
+            for (fpath, sheet), (hits, misses) in self.lookups.items():
+                name = fpath if sheet is None else '%s#%s' % (fpath, sheet)
+                if len(name) > 50:
+                    name = '...' + name[-47:]
+                lines.append('%-50s %8d %8d' % (name, hits, misses))
+        return '\n'.join(lines)
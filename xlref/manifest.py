@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the manifest of the incremental reading of the references.
+"""
+import os
+import json
+import uuid
+import hashlib
+import logging
+import os.path as osp
+from .cache import _file_hash
+
+log = logging.getLogger(__name__)
+
+
+def entry_key(references, curr_dir):
+    """
+    Return the key of an output entry.
+
+    :param references:
+        Data excel references of the entry.
+    :type references: object
+
+    :param curr_dir:
+        Directory of the relative references.
+    :type curr_dir: str
+
+    :return:
+        Entry key.
+    :rtype: str
+    """
+    s = json.dumps([references, osp.abspath(curr_dir)], sort_keys=True,
+                   default=repr)
+    return hashlib.sha1(s.encode()).hexdigest()
+
+
+def file_state(fpath):
+    """
+    Return the state of a file (`None` if missing).
+
+    :param fpath:
+        File path.
+    :type fpath: str
+
+    :return:
+        Modification time, size and content hash.
+    :rtype: dict
+    """
+    try:
+        stat = os.stat(fpath)
+        return {
+            'mtime': stat.st_mtime_ns, 'size': stat.st_size,
+            'hash': _file_hash(fpath)
+        }
+    except OSError:
+        return None
+
+
+class Manifest:
+    """
+    Sidecar manifest of the workbooks each output entry depends on.
+
+    :param fpath:
+        Manifest file path.
+    :type fpath: str
+
+    :param entries:
+        Key and dependencies of each output entry.
+    :type entries: list[dict]
+
+    :param files:
+        State of each dependency (see :func:`file_state`).
+    :type files: dict[str, dict]
+    """
+    version = 1
+
+    def __init__(self, fpath, entries=(), files=None):
+        self.fpath, self.entries = fpath, list(entries)
+        self.files = {} if files is None else files
+
+    @classmethod
+    def output(cls, output_fpath):
+        """
+        Return the manifest of an output file.
+
+        :param output_fpath:
+            Output file path.
+        :type output_fpath: str
+
+        :return:
+            Stored manifest (empty when missing or invalid).
+        :rtype: Manifest
+        """
+        fpath = '%s.manifest.json' % output_fpath
+        try:
+            with open(fpath) as f:
+                d = json.load(f)
+            if d['version'] == cls.version:
+                return cls(fpath, d['entries'], d['files'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return cls(fpath)
+
+    def changed(self):
+        """
+        Return the dependencies that have changed since they were recorded.
+
+        The content hash is computed only when modification time or size
+        differ.
+
+        :return:
+            Absolute paths of the changed files.
+        :rtype: set[str]
+        """
+        res = set()
+        for fpath, state in self.files.items():
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                res.add(fpath)
+                continue
+            if (stat.st_mtime_ns, stat.st_size) == (
+                    state['mtime'], state['size']):
+                continue
+            new = file_state(fpath)
+            if new is None or new['hash'] != state['hash']:
+                res.add(fpath)
+            else:  # Touched only.
+                self.files[fpath] = new
+        return res
+
+    def record(self, key, files, states=None):
+        """
+        Append an output entry.
+
+        :param key:
+            Entry key (see :func:`entry_key`).
+        :type key: str
+
+        :param files:
+            Absolute paths of the workbooks the entry depends on.
+        :type files: collections.abc.Iterable[str]
+
+        :param states:
+            File states taken before reading the workbooks (the missing are
+            computed now).
+        :type states: dict[str, dict]
+        """
+        files, states = sorted(files), states or {}
+        for fpath in files:
+            state = states[fpath] if fpath in states else file_state(fpath)
+            if state is not None:
+                self.files[fpath] = state
+        self.entries.append({'key': key, 'files': files})
+
+    def dump(self):
+        """
+        Write the manifest.
+
+        :return:
+            Manifest file path.
+        :rtype: str
+        """
+        used = {f for e in self.entries for f in e['files']}
+        d = {
+            'version': self.version, 'entries': self.entries,
+            'files': {k: v for k, v in self.files.items() if k in used}
+        }
+        tmp = '%s.%s.tmp' % (self.fpath, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump(d, f)
+        os.replace(tmp, self.fpath)
+        return self.fpath
@@ -8,17 +8,26 @@
 """
 It provides xlparser reference parser class.
 """
-import io
 import re
 import string
+import functools
 import logging
+import contextlib
+import contextvars
 import numpy as np
 import os.path as osp
-from .filters import FILTERS
+from .filters import FILTERS, writable
+from .cache import SheetCache
+from .engines import ENGINES, isnull
+from .instrument import span, event, enabled
 from .errors import InvalidSyntax, InvalidReference, NoFullCell
 
 log = logging.getLogger(__name__)
 
+#: States of the workbooks opened by the references being read, and function
+#: taking them.
+_dependencies = contextvars.ContextVar('dependencies', default=(None, None))
+
 _primitive_dir = dict(zip(
     'LURD', np.array([[0, -1], [-1, 0], [0, 1], [1, 0]], int)
 ))
@@ -73,6 +82,214 @@ def _num2col(num):
     return '%s%s' % (chr1, chr(ord('A') + num % 26))
 
 
+class _Lines:
+    """Sorted positions of the full cells along the rows (or columns)."""
+
+    def __init__(self, lines, pos, n):
+        self.pos, self.ptr = pos, np.searchsorted(lines, np.arange(n + 1))
+        st, nd = self.ptr[:-1], self.ptr[1:]
+        full = st < nd
+        self.lo = np.full(n, np.iinfo(int).max, int)  # First full position.
+        self.hi = np.full(n, -1, int)  # Last full position.
+        self.lo[full], self.hi[full] = pos[st[full]], pos[nd[full] - 1]
+
+    @property
+    def nbytes(self):
+        return self.pos.nbytes + self.ptr.nbytes + self.lo.nbytes + \
+            self.hi.nbytes
+
+    def ray(self, line, start, step):
+        if not 0 <= line < self.lo.shape[0]:
+            return None
+        pos = self.pos[self.ptr[line]:self.ptr[line + 1]]
+        if step > 0:
+            i = np.searchsorted(pos, start, 'left')
+            return pos[i] if i < pos.shape[0] else None
+        i = np.searchsorted(pos, start, 'right') - 1
+        return pos[i] if i >= 0 else None
+
+    def walk(self, line, bound, start, step, wstep):
+        if wstep > 0:
+            lines = np.arange(line, min(bound + 1, self.lo.shape[0]))
+        else:
+            lines = np.arange(min(line, self.lo.shape[0] - 1), -1, -1)
+        if step > 0:
+            b = self.hi[lines] >= start
+        else:
+            b = self.lo[lines] <= start
+        i = b.argmax() if b.shape[0] else 0
+        return lines[i] if b.shape[0] and b[i] else None
+
+
+class _FullCellsIndex:
+    """Index of the full cells to find the first full cell along moves."""
+
+    def __init__(self, full_cells):
+        n_rows, n_cols = full_cells.shape
+        self.rows = _Lines(*np.nonzero(full_cells), n_rows)
+        cols, rows = np.nonzero(full_cells.T)
+        self.cols = _Lines(cols, rows, n_cols)
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.cols.nbytes
+
+    def find(self, cell, moves, dn):
+        """
+        Find the first full cell from `cell` along the `moves`.
+
+        :param cell:
+            Starting cell (row, column).
+        :type cell: tuple[int]
+
+        :param moves:
+            Primitive directions (e.g., `'RD'`).
+        :type moves: str
+
+        :param dn:
+            Last full row and column.
+        :type dn: tuple[int]
+
+        :return:
+            Full cell (row, column) or `None` if not found.
+        :rtype: tuple[int]
+        """
+        horizontal, step = moves[0] in 'LR', _primitive_dir[moves[0]].sum()
+        lines, axis = (self.rows, 0) if horizontal else (self.cols, 1)
+        line, start = cell[axis], cell[1 - axis]
+        if len(moves) > 1:
+            wstep = _primitive_dir[moves[1]].sum()
+            line = lines.walk(line, dn[axis], start, step, wstep)
+            if line is None:
+                return None
+        pos = lines.ray(line, start, step)
+        if pos is None:
+            return None
+        return (line, pos) if horizontal else (pos, line)
+
+
+class _SummedAreaTable:
+    """Summed-area table of the full cells to count them in any rectangle."""
+
+    def __init__(self, full_cells):
+        n_rows, n_cols = full_cells.shape
+        dtype = np.int32 if n_rows * n_cols < 2 ** 31 else np.int64
+        self.sat = np.zeros((n_rows + 1, n_cols + 1), dtype)
+        np.cumsum(
+            np.cumsum(full_cells, 0, dtype=dtype), 1, out=self.sat[1:, 1:]
+        )
+
+    @property
+    def nbytes(self):
+        return self.sat.nbytes
+
+    def count(self, r0, r1, c0, c1):
+        """
+        Count the full cells in the rectangle `[r0:r1, c0:c1]`.
+
+        :return:
+            Number of full cells.
+        :rtype: int
+        """
+        n, m = self.sat.shape
+        r0, r1 = min(max(r0, 0), n - 1), min(max(r1, 0), n - 1)
+        c0, c1 = min(max(c0, 0), m - 1), min(max(c1, 0), m - 1)
+        if r0 >= r1 or c0 >= c1:
+            return 0
+        s = self.sat
+        return int(s[r1, c1] - s[r0, c1] - s[r1, c0] + s[r0, c0])
+
+    def counts(self, r0, r1, c0, c1, transpose=False):
+        """
+        Vectorized version of :meth:`count`.
+
+        :return:
+            Number of full cells.
+        :rtype: numpy.ndarray
+        """
+        if transpose:
+            r0, r1, c0, c1 = c0, c1, r0, r1
+        n, m = self.sat.shape
+        r0, r1 = np.clip(r0, 0, n - 1), np.clip(r1, 0, n - 1)
+        c0, c1 = np.clip(c0, 0, m - 1), np.clip(c1, 0, m - 1)
+        s = self.sat
+        v = s[r1, c1] - s[r0, c1] - s[r1, c0] + s[r0, c0]
+        return np.where((r0 < r1) & (c0 < c1), v, 0)
+
+    def expand(self, rng, delta, lims):
+        """
+        Expand a range until the full cells on its new edges are exhausted.
+
+        At each iteration every side of the range `[r0, r1, c0, c1]` is moved
+        by its `delta` (clipped to `lims`) when the new edge line contains full
+        cells out of the current range.
+
+        :return:
+            Expanded range.
+        :rtype: list[int]
+        """
+        def out(r0, r1, c0, c1):  # Full cells out of the current range.
+            return self.count(r0, r1, c0, c1) - self.count(
+                max(r0, rng[0]), min(r1, rng[1]), max(c0, rng[2]),
+                min(c1, rng[3])
+            )
+
+        n, m = self.sat.shape
+        b = rng[0] < min(rng[1], n - 1) and rng[2] < min(rng[3], m - 1)
+        while b:
+            r0, r1, c0, c1 = r = [
+                min(max(v + d, lo), hi) for v, d, (lo, hi) in
+                zip(rng, delta, lims)
+            ]
+            b = [
+                out(r0, r0 + 1, c0, c1) > 0, out(r1 - 1, r1, c0, c1) > 0,
+                out(r0, r1, c0, c0 + 1) > 0, out(r0, r1, c1 - 1, c1) > 0
+            ]
+            r = [v if k else o for k, v, o in zip(b, r, rng)]
+            moved = [i for i, (v, o) in enumerate(zip(r, rng)) if v != o]
+            if len(moved) == 1:
+                i = moved[0]
+                if (r[i] - rng[i]) * delta[i] > 0:  # Only one side grows.
+                    r = self._gallop(r, i, delta, lims)
+            b, rng = bool(moved), r  # Stop when the range does not change.
+        return rng
+
+    def _gallop(self, rng, side, delta, lims):
+        # Jump over the iterations of `expand` that move only the given side.
+        cand = [min(max(v + d, lo), hi) for v, d, (lo, hi) in
+                zip(rng, delta, lims)]
+        t = side >= 2  # Work on columns as rows.
+        a0, a1, b0, b1 = rng[2:] + rng[:2] if t else rng
+        ca0, ca1, cb0, cb1 = cand[2:] + cand[:2] if t else cand
+        (lo, hi), step = lims[side], delta[side]
+        if cb0 > b0 or cb1 < b1 or not step:
+            return rng
+        cur, k, end = rng[side], 16, side % 2
+        while True:
+            p = cur + np.arange(1, k + 1) * step
+            p = np.minimum(p, hi) if end else np.maximum(p, lo)
+            prev = np.append(cur, p[:-1])
+            if end:
+                ok = (p != prev) & (self.counts(p - 1, p, cb0, cb1, t) > 0)
+                s0, s1 = ca0, p
+            else:
+                ok = (p != prev) & (self.counts(p, p + 1, cb0, cb1, t) > 0)
+                s0, s1 = p, ca1
+            if cb0 < b0:
+                ok &= self.counts(s0, s1, cb0, cb0 + 1, t) == 0
+            if cb1 > b1:
+                ok &= self.counts(s0, s1, cb1 - 1, cb1, t) == 0
+            i = k if ok.all() else int(ok.argmin())
+            if i:
+                cur = int(p[i - 1])
+            if i < k:
+                break
+            k *= 2
+        rng = list(rng)
+        rng[side] = cur
+        return rng
+
+
 class Range:
     def __init__(self, st_cell, nd_cell):
         (self.r0, self.c0), (self.r1, self.c1) = st_cell, nd_cell
@@ -86,47 +303,155 @@ class Range:
         )
 
 
+class _FrozenDict(dict):
+    """Read-only dictionary of the compiled filters."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('%s is immutable.' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+        update = __ior__ = _readonly
+
+    def __hash__(self):
+        return hash(tuple(self.items()))
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+
+def _freeze(obj):
+    # Filters with read-only args and kwargs (lists are converted to tuples).
+    if isinstance(obj, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return tuple(map(_freeze, obj))
+    return obj
+
+
+class CompiledRef:
+    """
+    Immutable and hashable compiled reference.
+
+    The filters are compared by their source string, their args and kwargs
+    are read-only (i.e., lists are converted to tuples).
+    """
+    __slots__ = (
+        'file', 'sheet', 'st_ref', 'nd_ref', 'range_exp', 'filters', '_key'
+    )
+
+    def __init__(self, file, sheet, st_ref, nd_ref, range_exp, filters,
+                 source='[]'):
+        it = zip(self.__slots__, (
+            file, sheet, st_ref, nd_ref, range_exp, _freeze(list(filters)),
+            (file, sheet, st_ref, nd_ref, range_exp, source)
+        ))
+        for k, v in it:
+            object.__setattr__(self, k, v)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('%s is immutable.' % self.__class__.__name__)
+
+    __delattr__ = __setattr__
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledRef) and self._key == other._key
+
+    def __repr__(self):
+        return '%s%r' % (self.__class__.__name__, self._key)
+
+    def _asdict(self):
+        return {k: getattr(self, k) for k in self.__slots__[:-1]}
+
+
+def _file_size(fpath):
+    try:
+        return osp.getsize(fpath)
+    except OSError:  # File not on disk (e.g., custom opener).
+        return 0
+
+
+def _estimate(workbook, name):
+    # Memory of a sheet as object grid, from the shape declared in the file.
+    shape = workbook.shape(name)
+    return shape[0] * shape[1] * np.dtype(object).itemsize if shape else 0
+
+
 # noinspection PyTypeChecker
 class Ref:
     """Reference parser"""
     _curr_dir = '.'
-    _engines = {
-        'xlsx': 'openpyxl',
-        'xlsxm': 'openpyxl',
-        'xls': 'xlrd',
-        'xlsm': 'openpyxl',
-        'odf': 'odf',
-        'ods': 'odf',
-        'odt': 'odf',
-        'csv': 'none',
-        'xlsb': 'pyxlsb',
-        None: 'openpyxl'
-    }
+    _engines = ENGINES
     _re = _re_xl_ref_parser
-    _open_sheet_kw = {'header': None}
     _open = open
+    #: Return read-only views of the cached sheets instead of private copies.
+    zero_copy = False
 
-    def _match(self, ref):
-        m = self._re.match(ref)
+    @classmethod
+    def _match(cls, ref):
+        m = cls._re.match(ref)
         if not m:
             raise InvalidSyntax(ref)
         return m.groupdict()
 
-    def __init__(self, ref, parent=None, cache=None):
+    def __init__(self, ref, parent=None, cache=None, store=None):
         try:
-            d = self._match(ref)
-            p = d.pop
-            d['st_ref'] = self._ref(p('st_col'), p('st_row'), p('st_mov'))
-            d['nd_ref'] = self._ref(p('nd_col'), p('nd_row'), p('nd_mov'))
-            d['filters'] = self._parse_filters(d['filters'] or '[]')
-            self.ref = d
+            self.ref = d = parse_reference(ref, type(self))._asdict()
+            d['filters'] = list(d['filters'])
             self.parent = parent
-            self.cache = {} if cache is None else cache
+            self.cache = SheetCache() if cache is None else cache
+            if parent is not None:  # Nested references share the opener.
+                self._open = parent._open
+                store = parent.store if store is None else store
+            self.store = store
         except InvalidSyntax as ex:
             raise ex
         except Exception as ex:
             raise InvalidReference(ref, ex)
 
+    @classmethod
+    def resolve_many(cls, refs, parent=None, cache=None, store=None):
+        """
+        Resolve many references, grouped by their target sheet.
+
+        The references of the same sheet are resolved one after the other,
+        sharing the sheet and its derived structures (e.g., `full_cells`,
+        `margins` and indexes).
+
+        :param refs:
+            Reference strings.
+        :type refs: collections.abc.Iterable[str]
+
+        :param parent:
+            Parent parser of the relative references.
+        :type parent: Ref
+
+        :param cache:
+            In-memory cache of the parsed workbooks and sheets.
+        :type cache: xlref.cache.SheetCache
+
+        :param store:
+            Persistent cache of the parsed sheets.
+        :type store: xlref.cache.DiskCache
+
+        :return:
+            Captured values, in the same order of the references.
+        :rtype: list
+        """
+        if cache is None:
+            cache = SheetCache() if parent is None else parent.cache
+        refs = [cls(r, parent, cache, store) for r in refs]
+        groups = {}  # Sheets are opened when their group is resolved.
+        for i, ref in enumerate(refs):
+            groups.setdefault(ref._target(), []).append(i)
+        values = [None] * len(refs)
+        for index in groups.values():
+            for i in index:
+                values[i] = refs[i].values
+        return values
+
     @staticmethod
     def _parse_filters(s):
         from json import loads
@@ -142,31 +467,24 @@ class Ref:
         mov = cell_mov.upper() if cell_mov else None
         return (row, col), mov
 
+    def _target(self):
+        # Parsed file path and lower sheet name, without opening them.
+        file, sheet, parent = self.ref['file'], self.ref['sheet'], self.parent
+        fpath = parent.ref.get('fpath') if parent else None
+        if file:
+            curr_dir = osp.dirname(fpath) if parent else self._curr_dir
+            fpath = osp.abspath(osp.join(curr_dir, file))
+        if sheet:
+            return fpath, sheet.lower()
+        return fpath, None if parent else ''  # Parent or first sheet.
+
     def _open_workbook(self, fpath):
-        from pandas import ExcelFile
         ext = osp.splitext(fpath.lower())[1][1:]
-        engine = self._engines.get(ext, self._engines[None])
-
-        if engine == 'none':
-            ExcelFile._engines['none'] = lambda *args, **kwargs: None
-            wb = ExcelFile(io.BytesIO(), engine=engine)
-            wb.sheet_indices = {'sheet1': 0}
-        else:
-            with self._open(fpath, 'rb') as f:
-                wb = ExcelFile(io.BytesIO(f.read()), engine=engine)
-            wb.sheet_indices = {
-                k.lower(): i for i, k in enumerate(wb.sheet_names)
-            }
-        if ext in ('csv',):
-            import pandas as pd
-            sn = {j: i for i, j in wb.sheet_indices.items()}[0]
-            with self._open(fpath, 'rb') as f:
-                self.cache[(wb, sn)] = pd.read_csv(f, header=None).values
-        return wb
+        wb = self._engines.get(ext, self._engines[None])(fpath, self._open)
+        return wb if self.store is None else self.store.book(wb)
 
     def _open_sheet(self, workbook, name):
-        name = getattr(workbook, 'sheet_indices', {}).get(name, name)
-        return workbook.parse(name, **self._open_sheet_kw).values
+        return workbook.sheet(name)
 
     @property
     def book(self):
@@ -177,10 +495,15 @@ class Ref:
                 if self.parent:
                     curr_dir = osp.dirname(self.parent.ref['fpath'])
                 self.ref['fpath'] = fp = osp.abspath(osp.join(curr_dir, fp))
-                if fp in self.cache:
-                    wb = self.cache[fp]
-                else:
-                    self.cache[fp] = wb = self._open_workbook(fp)
+                deps, state = _dependencies.get()
+                if deps is not None and fp not in deps:
+                    deps[fp] = state(fp)  # Before reading it.
+                wb = self.cache.get(fp)
+                event('cache', file=fp, hit=wb is not None)
+                if wb is None:
+                    with span('ref.book', file=fp) as s:
+                        self.cache[fp] = wb = self._open_workbook(fp)
+                        s.update(nbytes=_file_size(fp))
             else:
                 self.ref['fpath'] = self.parent.ref.get('fpath')
                 wb = self.parent.book
@@ -188,65 +511,89 @@ class Ref:
         return self.ref['xl_book']
 
     @property
-    def sheet(self):
+    def lazy_sheet(self):
         if 'xl_sheet' not in self.ref:
             sn = self.ref['sheet']
             if not sn and not self.parent:
-                sn = {j: i for i, j in self.book.sheet_indices.items()}[0]
+                sn = self._first_sheet()
             if sn:
                 wb, sn = self.book, sn.lower()
-                if (wb, sn) in self.cache:
-                    sheet = self.cache[(wb, sn)]
-                else:
-                    self.cache[(wb, sn)] = sheet = self._open_sheet(wb, sn)
+                sheet = self.cache.get((wb, sn))
+                event('cache', file=self.ref['fpath'], sheet=sn,
+                      hit=sheet is not None)
+                if sheet is None:
+                    with span('ref.open_sheet', sheet=sn) as s:
+                        # Lazy sheets are estimated from the declared shape.
+                        n = _estimate(wb, sn) if enabled() else 0
+                        sheet = self._open_sheet(wb, sn)
+                        s.update(nbytes=getattr(sheet, 'nbytes', 0) or n)
+                    self.cache[(wb, sn)] = sheet
             else:
-                sheet = self.parent.sheet
+                sheet = self.parent.lazy_sheet
             self.ref['xl_sheet'] = sheet
         return self.ref['xl_sheet']
 
+    def _first_sheet(self):
+        return {j: i for i, j in self.book.sheet_indices.items()}[0]
+
+    def preload(self, sheets):
+        """
+        Load several sheets of the reference workbook at once.
+
+        :param sheets:
+            Lower sheet names (`''` is the first sheet).
+        :type sheets: list[str]
+
+        :return:
+            Estimated memory of the sheets that have been loaded, in bytes.
+        :rtype: int
+        """
+        wb, nbytes = self.book, 0
+        names = {sn or self._first_sheet() for sn in sheets}
+        names = sorted(
+            sn for sn in names
+            if sn in wb.sheet_indices and (wb, sn) not in self.cache
+        )  # Unknown sheets are reported when the references are read.
+        if names:
+            nbytes = sum(_estimate(wb, sn) for sn in names)
+            log.info('Loading sheets %s of %s (estimated %d bytes).',
+                     names, self.ref['fpath'], nbytes)
+            for sn, sheet in wb.sheets(names).items():
+                self.cache[(wb, sn)] = sheet
+        return nbytes
+
+    @property
+    def sheet(self):
+        with span('ref.sheet') as s:
+            v = self.lazy_sheet.values
+            s.update(nbytes=v.nbytes, shape=v.shape)
+        return v
+
     @property
     def full_cells(self):
-        if 'full_cells' not in self.ref:
-            from pandas import isnull
-            self.ref['full_cells'] = ~isnull(self.sheet)
-        return self.ref['full_cells']
+        with span('ref.full_cells') as s:
+            v = self.lazy_sheet.full_cells
+            s.update(nbytes=v.nbytes, shape=v.shape)
+        return v
 
     @property
     def margins(self):
-        if 'margins' not in self.ref:
-            indices = np.array(np.where(self.full_cells)).T
-            if indices.shape[0]:
-                up_r, up_c = indices.min(0)
-                dn_r, dn_c = indices.max(0)
-            else:
-                up_r = up_c = dn_r = dn_c = 0
-            m = {'^': up_r, '_': dn_r}, {'^': up_c, '_': dn_c}
-            self.ref['margins'] = m
-        return self.ref['margins']
+        with span('ref.margins'):
+            return self.lazy_sheet.margins
 
     def _target_full(self, cell, moves):
-        up, dn = (0, 0), (self.margins[0]['_'], self.margins[1]['_'])
-        mv = _primitive_dir[moves[0]]  # first move
-        c0, full_cells = np.array(cell), self.full_cells
-
+        dn, c0 = (self.margins[0]['_'], self.margins[1]['_']), list(cell)
         if 'U' in moves and not c0[0] <= dn[0]:
             c0[0] = dn[0]
         if 'L' in moves and not c0[1] <= dn[1]:
             c0[1] = dn[1]
-
-        while (up <= c0).all() and (c0 <= dn).all():
-            c1 = c0.copy()
-            while (up <= c1).all():
-                try:
-                    if full_cells[c1[0], c1[1]]:
-                        return c1
-                except IndexError:
-                    break
-                c1 += mv
-            try:
-                c0 += _primitive_dir[moves[1]]  # second move
-            except IndexError:
-                break
+        if 0 <= c0[0] <= dn[0] and 0 <= c0[1] <= dn[1]:
+            index = self.lazy_sheet.derive(
+                'index', lambda sheet: _FullCellsIndex(sheet.full_cells)
+            )
+            c1 = index.find(c0, moves, dn)
+            if c1 is not None:
+                return c1
         raise NoFullCell(cell, moves)
 
     def _resolve_ref(self, ref, pcell=None):
@@ -259,69 +606,164 @@ class Ref:
             col = self.margins[1][col]
         elif col == '.':
             col = pcell[1]
-        try:
-            state = self.full_cells[row, col]
-        except IndexError:
-            state = False
-        if not (state or ref[1] is None):
+        if not (ref[1] is None or self._is_full(row, col)):
             row, col = self._target_full((row, col), ref[1])
         return row, col
 
+    def _is_full(self, row, col):
+        v = self.lazy_sheet.band(row, row + 1, col, col + 1)
+        return not isnull(v[0, 0])
+
     def _expand_range(self, st, nd, range_exp):
         range_exp, exp = range_exp.upper(), np.zeros((2, 2), int)
         for k, i in (('L', 0), ('U', 0), ('R', 1), ('D', 1)):
             exp[:, i] += _primitive_dir[k] * range_exp.count(k)
-        # noinspection PyUnresolvedReferences
-        empty, r0 = ~self.full_cells, np.array((st, nd), int)
-        rng = r0.T + [0, 1]
-        b = np.array([all(empty[slice(*rng[0]), slice(*rng[1])].shape)])
-        margins = np.array([(m['^'], m['_'] + 1) for m in self.margins]).T
-        while b.any():
-            empty[slice(*rng[0]), slice(*rng[1])] = True
-            r = np.clip(rng + exp, margins[0, :, None], margins[1, :, None])
-            b = ~np.array([
-                empty[r[0] - [0, 1], slice(*r[1])].all(1),
-                empty[slice(*r[0]), r[1] - [0, 1]].all(0)
-            ])
-            rng = np.where(b, r, rng)
-        r = (rng - [0, 1]).T
-        return tuple(np.minimum(r[0], r0[0])), tuple(np.maximum(r[1], r0[1]))
+        lims = [(m['^'], m['_'] + 1) for m in self.margins for _ in range(2)]
+        sat = self.lazy_sheet.derive(
+            'sat', lambda sheet: _SummedAreaTable(sheet.full_cells)
+        )
+        r0, r1, c0, c1 = sat.expand(
+            [st[0], nd[0] + 1, st[1], nd[1] + 1], exp.ravel().tolist(), lims
+        )
+        return (min(r0, st[0]), min(c0, st[1])), (
+            max(r1 - 1, nd[0]), max(c1 - 1, nd[1])
+        )
 
     @property
     def range(self):
         if 'rect' not in self.ref:
-            nd = st = self._resolve_ref(self.ref['st_ref'])
-            nd_ref, range_exp = self.ref['nd_ref'], self.ref['range_exp']
-            if nd_ref is not None:
-                nd = self._resolve_ref(nd_ref, st)
-                r, c = (st[0], nd[0]), (st[1], nd[1])
-                st, nd = (min(r), min(c)), (max(r), max(c))
-            if range_exp is not None:
-                st, nd = self._expand_range(st, nd, range_exp)
-            self.ref['rect'] = Range(st, nd)
+            with span('ref.range'):
+                self.ref['rect'] = self._range()
         return self.ref['rect']
 
+    def _range(self):
+        nd = st = self._resolve_ref(self.ref['st_ref'])
+        nd_ref, range_exp = self.ref['nd_ref'], self.ref['range_exp']
+        if nd_ref is not None:
+            nd = self._resolve_ref(nd_ref, st)
+            r, c = (st[0], nd[0]), (st[1], nd[1])
+            st, nd = (min(r), min(c)), (max(r), max(c))
+        if range_exp is not None:
+            st, nd = self._expand_range(st, nd, range_exp)
+        return Range(st, nd)
+
     @property
     def values(self):
         if 'values' not in self.ref:
-            r0, c0, r1, c1 = self.range.get()
-            v = self.sheet[r0:r1 + 1, c0:c1 + 1]
-            shape, s = (r1 - r0 + 1, c1 - c0 + 1), tuple(v.shape)
-            if s != shape:  # Add empty values.
-                c = np.full(shape, np.nan, object)
-                c[:s[0], :s[1]] = v
-                v = c
-            self.ref['values'] = compile_filters(self.ref['filters'], self)(v)
+            with span('ref.values') as s:
+                r0, c0, r1, c1 = self.range.get()
+                v = self.lazy_sheet.band(r0, r1 + 1, c0, c1 + 1)
+                if not (self.zero_copy or v.flags.writeable):
+                    v = np.array(v)  # Private copy of the cached sheet.
+                self.ref['values'] = v = compile_filters(
+                    self.ref['filters'], self
+                )(v)
+                s.update(nbytes=getattr(v, 'nbytes', 0),
+                         shape=getattr(v, 'shape', None))
         return self.ref['values']
 
 
+@functools.lru_cache(4096)
+def _compile(pclass, ref):
+    if not isinstance(ref, str) or '#' not in ref:  # Skip the regex.
+        raise InvalidSyntax(ref)
+    d = pclass._match(ref)
+    try:
+        p, filters = d.pop, d['filters'] or '[]'
+        return CompiledRef(
+            d['file'], d['sheet'],
+            pclass._ref(p('st_col'), p('st_row'), p('st_mov')),
+            pclass._ref(p('nd_col'), p('nd_row'), p('nd_mov')),
+            d['range_exp'], pclass._parse_filters(filters), filters
+        )
+    except Exception as ex:
+        raise InvalidReference(ref, ex)
+
+
+def parse_reference(ref, pclass=None):
+    """
+    Compile a reference string (memoized by parser class).
+
+    :param ref:
+        Reference string (e.g., `'file.xlsx#sheet!A1:B2'`).
+    :type ref: str
+
+    :param pclass:
+        Reference parser class, whose `_re`, `_match`, `_ref` and
+        `_parse_filters` are used (default :class:`Ref`).
+    :type pclass: type
+
+    :return:
+        Compiled reference.
+    :rtype: CompiledRef
+    """
+    return _compile(Ref if pclass is None else pclass, ref)
+
+
+@contextlib.contextmanager
+def track_dependencies(state=None):
+    """
+    Record the workbooks opened by the references read within the context,
+    including the nested ones (e.g., from `ref` and `recursive` filters).
+
+    The state of each workbook is taken on its first use within the context,
+    before it is read.
+
+    :param state:
+        Function returning the state of a file (default
+        :func:`xlref.manifest.file_state`).
+    :type state: collections.abc.Callable
+
+    :return:
+        States of the workbooks by absolute path, filled while the context is
+        active.
+    :rtype: dict[str, dict]
+    """
+    if state is None:
+        from .manifest import file_state as state
+    deps = {}
+    token = _dependencies.set((deps, state))
+    try:
+        yield deps
+    finally:
+        _dependencies.reset(token)
+
+
+def read_many(refs, cache=None, store=None):
+    """
+    Read many references, sharing the parsed workbooks and sheets.
+
+    :param refs:
+        Reference strings.
+    :type refs: collections.abc.Iterable[str]
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :return:
+        Captured values, in the same order of the references.
+    :rtype: list
+    """
+    return Ref.resolve_many(refs, cache=cache, store=store)
+
+
 def compile_filters(filters, parent):
     it = (dict(k) if isinstance(k, dict) else {'fun': k} for k in filters)
     it = [(v.pop('fun'), v.get('args', ()), v.get('kw', v)) for v in it]
 
     def call_filters(value):
         for k, args, kw in it:
-            value = FILTERS[k](parent, value, *args, **kw)
+            func = FILTERS[k]
+            with span('filter.%s' % k) as s:
+                if getattr(func, 'mutates', False):
+                    value = writable(value)
+                value = func(parent, value, *args, **kw)
+                s.update(nbytes=getattr(value, 'nbytes', 0))
         return value
 
     return call_filters
@@ -7,21 +7,58 @@
 # You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
 """
 Defines the file processing chain model `dsp`.
+
+The `dsp` (and schedula) is built on first access, while :func:`run` executes
+the same chain without it (e.g., for the command line interface).
 """
 import os
+import uuid
+import logging
 import os.path as osp
-import schedula as sh
+import functools
 import collections
+from .instrument import timed, timed_iter, in_context
+
+log = logging.getLogger(__name__)
+
+#: Default inputs of the process model.
+DEFAULTS = {
+    'input_references': (), 'input_fpaths': (), 'store': None, 'cache': None,
+    'jobs': None, 'processes': False, 'stream': False, 'incremental': False
+}
+_nodes = []  # Functions and options of the process model.
+
+
+def _node(**kwargs):
+    def decorator(func):
+        _nodes.append((func, kwargs))
+        return func
+
+    return decorator
+
+
+@functools.lru_cache(None)
+def _dsp():
+    import schedula as sh
+    dsp = sh.BlueDispatcher(name='Processing Model', raises=True)
+    for k, v in DEFAULTS.items():
+        dsp.add_data(k, v, 2)
+    for func, kwargs in _nodes:
+        sh.add_function(dsp, **kwargs)(func)
+    return dsp
+
+
+def __getattr__(name):
+    if name == 'dsp':  # Process Model.
+        return _dsp()
+    raise AttributeError("module %s has no attribute %s" % (__name__, name))
 
-#: Process Model.
-dsp = sh.BlueDispatcher(name='Processing Model', raises=True)
-dsp.add_data('input_references', (), 2)
-dsp.add_data('input_fpaths', (), 2)
 
 _FileRefs = collections.namedtuple('_FileRefs', ('obj', 'fpath'))
 
 
-@sh.add_function(dsp, outputs=['file_references'])
+@_node(outputs=['file_references'])
+@timed('process.load_json')
 def load_json(input_fpaths):
     """
     Load the data excel references from files.
@@ -42,7 +79,8 @@ def load_json(input_fpaths):
     return res
 
 
-@sh.add_function(dsp, inputs_kwargs=True, outputs=['references'])
+@_node(inputs_kwargs=True, outputs=['references'])
+@timed('process.merge_references')
 def merge_references(input_references=(), file_references=()):
     """
     Merge data excel references.
@@ -62,41 +100,193 @@ def merge_references(input_references=(), file_references=()):
     return list(input_references) + list(file_references)
 
 
-def _read(references, curr_dir, eskip, pclass, cache):
+def _read(references, curr_dir, eskip, pclass, cache, store=None):
+    args = curr_dir, eskip, pclass, cache, store
     if isinstance(references, list):
-        return [_read(v, curr_dir, eskip, pclass, cache) for v in references]
+        return [_read(v, *args) for v in references]
     elif isinstance(references, dict):
-        args = curr_dir, eskip, pclass, cache
         return {_read(k, *args): _read(v, *args) for k, v in references.items()}
     try:
-        p = pclass(references, cache=cache)
+        p = pclass(references, cache=cache, store=store)
         p._curr_dir = curr_dir
         return p.values
     except eskip:
         return references
 
 
-@sh.add_function(dsp, outputs=['data'])
-def read_references(references):
+def _plan(references, curr_dir, parse, plan):
+    args = curr_dir, parse, plan
+    if isinstance(references, list):
+        for v in references:
+            _plan(v, *args)
+    elif isinstance(references, dict):
+        for k, v in references.items():
+            _plan(k, *args)
+            _plan(v, *args)
+    elif isinstance(references, str):
+        try:
+            c = parse(references)
+        except Exception:  # Not a reference.
+            return
+        if c.file:
+            fpath = osp.abspath(osp.join(curr_dir, c.file))
+            plan.setdefault(fpath, set()).add((c.sheet or '').lower())
+
+
+def _references(references):
+    return [
+        isinstance(r, _FileRefs) and (r.obj, osp.dirname(r.fpath)) or (r, '.')
+        for r in references
+    ]
+
+
+@_node(outputs=['plan'])
+@timed('process.plan_references')
+def plan_references(references):
     """
-    Read recursively the list of data excel references.
+    Plan the workbooks and sheets to be loaded to read the references.
+
+    Only the file and sheet names of the references are parsed, hence the
+    sheets referenced by nested references (e.g., `recursive` filter) are not
+    included.
 
     :param references:
         Full list of data excel references.
     :type references: list
 
     :return:
-        Data output.
-    :rtype: list
+        Lower sheet names (`''` is the first sheet) by workbook file path.
+    :rtype: dict[str, list[str]]
+    """
+    from .parser import parse_reference
+    plan = {}
+    for r, d in _references(references):
+        _plan(r, d, parse_reference, plan)
+    return {k: sorted(v) for k, v in sorted(plan.items())}
+
+
+def _load(item, pclass, cache, store):
+    fpath, sheets = item
+    try:
+        p = pclass('%s#A1' % fpath, cache=cache, store=store)
+        return p.preload(sheets)
+    except Exception:  # Errors are raised when the references are read.
+        book = cache.get(fpath)
+        cache.pop(fpath, None)
+        for k in list(cache):
+            if isinstance(k, tuple) and k[0] is book:
+                cache.pop(k, None)
+        return 0
+
+
+def _preload(plan, pclass, cache, store, jobs, processes=False):
+    from multiprocessing.pool import ThreadPool
+    jobs = jobs if jobs > 0 else os.cpu_count() or 1
+    if processes:
+        from .shared import load
+        n = load(plan, pclass, cache, store, jobs)
+        log.info('Loaded %d sheets in %d processes.', n, jobs)
+        return
+    load = in_context(functools.partial(
+        _load, pclass=pclass, cache=cache, store=store
+    ))
+    with ThreadPool(max(min(jobs, len(plan)), 1)) as pool:
+        nbytes = sum(pool.map(load, plan.items()))
+    log.info('Loaded %d workbooks (estimated %d bytes).', len(plan), nbytes)
+
+
+def iter_references(references, store=None, cache=None, jobs=None,
+                    plan=None, processes=False):
+    """
+    Read recursively the data excel references, one at a time.
+
+    :param references:
+        Full list of data excel references.
+    :type references: list
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param jobs:
+        Number of threads used to load the workbooks before reading the
+        references (`None` or `1` loads them on demand, `0` uses all CPUs).
+    :type jobs: int
+
+    :param plan:
+        Sheets to be loaded before reading the references when `jobs` is set.
+    :type plan: dict[str, list[str]]
+
+    :param processes:
+        Load the workbooks in a process pool instead of threads, handing off
+        the parsed sheets through shared memory.
+    :type processes: bool
+
+    :return:
+        Data output of each top-level reference.
+    :rtype: collections.abc.Iterator
     """
     from .parser import Ref
+    from .cache import SheetCache
     from .errors import InvalidReference
-    it = (
-        isinstance(r, _FileRefs) and (r.obj, osp.dirname(r.fpath)) or (r, '.')
-        for r in references
-    )
-    args = InvalidReference, Ref, {}
-    return [_read(r, d, *args) for r, d in it]
+    cache = SheetCache() if cache is None else cache
+    if jobs != 1 and jobs is not None:
+        if plan is None:
+            plan = plan_references(references)
+        _preload(plan, Ref, cache, store, jobs, processes)
+    args = InvalidReference, Ref, cache, store
+    for r, d in _references(references):
+        yield _read(r, d, *args)
+
+
+@_node(inputs_kwargs=True, outputs=['data'], weight=1)
+@timed('process.read_references')
+def read_references(references, store=None, cache=None, jobs=None,
+                    plan=None, processes=False, stream=False):
+    """
+    Read recursively the list of data excel references.
+
+    :param references:
+        Full list of data excel references.
+    :type references: list
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param jobs:
+        Number of threads used to load the workbooks before reading the
+        references (`None` or `1` loads them on demand, `0` uses all CPUs).
+    :type jobs: int
+
+    :param plan:
+        Sheets to be loaded before reading the references when `jobs` is set.
+    :type plan: dict[str, list[str]]
+
+    :param processes:
+        Load the workbooks in a process pool instead of threads, handing off
+        the parsed sheets through shared memory.
+    :type processes: bool
+
+    :param stream:
+        Return an iterator that reads the references while it is consumed
+        (e.g., to pipeline reading and writing).
+    :type stream: bool
+
+    :return:
+        Data output.
+    :rtype: list | collections.abc.Iterator
+    """
+    it = iter_references(references, store, cache, jobs, plan, processes)
+    return it if stream else list(it)
 
 
 def _json_default(o):
@@ -105,25 +295,421 @@ def _json_default(o):
         return o.tolist()
 
 
-@sh.add_function(dsp, outputs=['written'])
+_JSON_CHUNK = 4096  # Array items serialized at once.
+
+
+def _json_key(key, dumps):
+    # Same keys coercion of `json.dumps` (e.g., 1 -> "1", None -> "null").
+    if key is None or isinstance(key, (int, float)):
+        return dumps(key)
+    raise TypeError('keys must be str, int, float, bool or None, not %s' % (
+        key.__class__.__name__
+    ))
+
+
+def _write_json(obj, write, dumps):
+    import numpy as np
+    if isinstance(obj, np.ndarray) and obj.ndim > 1:
+        obj = iter(obj)  # Rows are serialized one at a time.
+    elif isinstance(obj, np.ndarray) and obj.size > _JSON_CHUNK:
+        write('[')
+        for i in range(0, obj.size, _JSON_CHUNK):
+            write('%s%s' % (i and ', ' or '', dumps(
+                obj[i:i + _JSON_CHUNK].tolist()
+            )[1:-1]))
+        return write(']')
+    elif isinstance(obj, np.ndarray):
+        return write(dumps(obj.tolist()))
+    elif isinstance(obj, dict):
+        write('{')
+        for i, (k, v) in enumerate(obj.items()):
+            if not isinstance(k, str):
+                k = _json_key(k, dumps)
+            write('%s%s: ' % (', ' if i else '', dumps(k)))
+            _write_json(v, write, dumps)
+        return write('}')
+    elif not isinstance(obj, (list, tuple, collections.abc.Iterator)):
+        return write(dumps(obj))
+    write('[')
+    for i, v in enumerate(obj):
+        if i:
+            write(', ')
+        _write_json(v, write, dumps)
+    write(']')
+
+
 def save_json(output_fpath, data):
     """
     Save data output in an JSON file.
 
+    The output is written into a temporary file that replaces the output file
+    only when all data have been written, hence a failure while consuming the
+    data leaves the previous output untouched.
+
     :param output_fpath:
         Output file path.
     :type output_fpath: str
 
     :param data:
-        Data output.
-    :type data: list
+        Data output, written while it is consumed when it is an iterator.
+    :type data: list | collections.abc.Iterator
 
     :return:
         File path where output are written.
     :rtype: str
     """
     import simplejson as json
+    dumps = functools.partial(
+        json.dumps, default=_json_default, ignore_nan=True
+    )
     os.makedirs(osp.dirname(output_fpath) or '.', exist_ok=True)
-    with open(output_fpath, 'w') as file:
-        json.dump(data, file, default=_json_default, ignore_nan=True)
+    tmp = '%s.%s.tmp' % (output_fpath, uuid.uuid4().hex)
+    try:
+        with open(tmp, 'w') as file:
+            _write_json(data, file.write, dumps)
+        os.replace(tmp, output_fpath)
+    finally:
+        if osp.exists(tmp):
+            os.remove(tmp)
     return output_fpath
+
+
+def _escape(key):
+    # Key-path component (`%` and `/` are percent-encoded).
+    return str(key).replace('%', '%25').replace('/', '%2F')
+
+
+def _flatten(data, key=None):
+    if key is None:  # Top-level references.
+        items = enumerate(data)
+    elif isinstance(data, dict):
+        items = data.items()
+    else:
+        yield key, data
+        return
+    for k, v in items:
+        k = _escape(k)
+        yield from _flatten(v, k if key is None else '%s/%s' % (key, k))
+
+
+def _array(value):
+    import numpy as np
+    from .engines import _typed
+    if isinstance(value, (list, tuple)):  # Items are stored as they are.
+        items, value = value, np.empty(len(value), object)
+        for i, v in enumerate(items):
+            value[i] = v
+        if any(isinstance(v, (list, tuple, dict, np.ndarray)) for v in items):
+            return value
+    value = np.asarray(value)
+    return _typed(value) if value.dtype == object else value
+
+
+def save_npz(output_fpath, data):
+    """
+    Save data output in a NumPy `.npz` file.
+
+    Each captured value is stored as an array named by its key-path (e.g.,
+    `'0/a/b'` for the key `'b'` of the key `'a'` of the first reference),
+    where `'%'` and `'/'` of the keys are percent-encoded (i.e., `'%25'` and
+    `'%2F'`). Numeric and datetime captures are stored with native dtypes,
+    while the others (e.g., lists) are `object` arrays (loadable with
+    `allow_pickle=True`).
+
+    :param output_fpath:
+        Output file path.
+    :type output_fpath: str
+
+    :param data:
+        Data output, written while it is consumed when it is an iterator.
+    :type data: list | collections.abc.Iterator
+
+    :return:
+        File path where output are written.
+    :rtype: str
+    """
+    import zipfile
+    import numpy as np
+    os.makedirs(osp.dirname(output_fpath) or '.', exist_ok=True)
+    with zipfile.ZipFile(output_fpath, 'w', allowZip64=True) as zf:
+        for key, value in _flatten(data):
+            with zf.open('%s.npy' % key, 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, _array(value))
+    return output_fpath
+
+
+def _arrow_column(value):
+    import pyarrow as pa
+    value = _array(value)
+    flat = value.ravel()
+    try:
+        arr = pa.array(flat, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):  # Mixed types.
+        arr = pa.array([None if v != v or v is None else str(v) for v in flat])
+    for n in value.shape[:0:-1]:
+        arr = pa.FixedSizeListArray.from_arrays(arr, n)
+    if value.ndim:
+        offsets = pa.array([0, value.shape[0]], pa.int32())
+        arr = pa.ListArray.from_arrays(offsets, arr)
+    return arr
+
+
+def _arrow_table(data):
+    import pyarrow as pa
+    return pa.table({k: _arrow_column(v) for k, v in _flatten(data)})
+
+
+def save_parquet(output_fpath, data):
+    """
+    Save data output in a Parquet file (requires `pyarrow`).
+
+    The output is a one-row table with a column per key-path (see
+    :func:`save_npz`), whose value is the captured range as nested lists of
+    its native type (mixed types are converted to strings).
+
+    :param output_fpath:
+        Output file path.
+    :type output_fpath: str
+
+    :param data:
+        Data output.
+    :type data: list | collections.abc.Iterator
+
+    :return:
+        File path where output are written.
+    :rtype: str
+    """
+    import pyarrow.parquet as pq
+    table = _arrow_table(data)
+    os.makedirs(osp.dirname(output_fpath) or '.', exist_ok=True)
+    pq.write_table(table, output_fpath)
+    return output_fpath
+
+
+def save_arrow(output_fpath, data):
+    """
+    Save data output in an Arrow IPC file (requires `pyarrow`).
+
+    The table layout is the same of :func:`save_parquet`.
+
+    :param output_fpath:
+        Output file path.
+    :type output_fpath: str
+
+    :param data:
+        Data output.
+    :type data: list | collections.abc.Iterator
+
+    :return:
+        File path where output are written.
+    :rtype: str
+    """
+    import pyarrow as pa
+    table = _arrow_table(data)
+    os.makedirs(osp.dirname(output_fpath) or '.', exist_ok=True)
+    with pa.OSFile(output_fpath, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return output_fpath
+
+
+#: Output writers by file extension (the others are written as JSON).
+WRITERS = {
+    'json': save_json,
+    'npz': save_npz,
+    'parquet': save_parquet,
+    'arrow': save_arrow,
+    'feather': save_arrow
+}
+
+
+@_node(outputs=['written'])
+@timed('process.write_output')
+def write_output(output_fpath, data):
+    """
+    Save data output with the writer of the output file extension.
+
+    :param output_fpath:
+        Output file path.
+    :type output_fpath: str
+
+    :param data:
+        Data output.
+    :type data: list | collections.abc.Iterator
+
+    :return:
+        File path where output are written.
+    :rtype: str
+    """
+    ext = osp.splitext(output_fpath.lower())[1][1:]
+    return WRITERS.get(ext, save_json)(output_fpath, data)
+
+
+def _previous(output_fpath):
+    ext = osp.splitext(output_fpath.lower())[1][1:]
+    if WRITERS.get(ext, save_json) is save_json:
+        import json
+        try:
+            with open(output_fpath) as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                return data
+        except (OSError, ValueError):
+            pass
+    return None
+
+
+@_node(
+    inputs_kwargs=True, outputs=['data', 'manifest'],
+    input_domain=lambda refs, output_fpath, incremental, *a, **kw: incremental
+)
+@timed('process.read_incremental')
+def read_incremental(references, output_fpath, incremental, store=None,
+                     cache=None, jobs=None, processes=False, stream=False):
+    """
+    Read the data excel references, re-reading only the output entries whose
+    workbooks have changed since the previous output.
+
+    The workbooks each entry depends on (including the nested references)
+    are recorded, with their modification time and content hash, in a
+    sidecar manifest of the output (i.e., `<output>.manifest.json`). The
+    unaffected entries are taken from the previous output (only JSON).
+
+    :param references:
+        Full list of data excel references.
+    :type references: list
+
+    :param output_fpath:
+        Output file path.
+    :type output_fpath: str
+
+    :param incremental:
+        Enable the incremental reading.
+    :type incremental: bool
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param jobs:
+        Number of threads used to load the workbooks of the changed entries.
+    :type jobs: int
+
+    :param processes:
+        Load the workbooks in a process pool instead of threads.
+    :type processes: bool
+
+    :param stream:
+        Return an iterator that reads the references while it is consumed.
+    :type stream: bool
+
+    :return:
+        Data output and manifest to be saved after the output.
+    :rtype: list | collections.abc.Iterator, xlref.manifest.Manifest
+    """
+    from .parser import Ref, track_dependencies
+    from .cache import SheetCache
+    from .manifest import Manifest, entry_key, file_state
+    cache = SheetCache() if cache is None else cache
+    old, refs = Manifest.output(output_fpath), _references(references)
+    previous = _previous(output_fpath) if old.entries else None
+    changed, reused = old.changed(), []
+    for i, (r, d) in enumerate(refs):
+        e = old.entries[i] if i < len(old.entries) else None
+        reused.append(
+            e is not None and previous is not None and i < len(previous) and
+            e['key'] == entry_key(r, d) and
+            not changed.intersection(e['files'])
+        )
+    todo = [r for r, skip in zip(references, reused) if not skip]
+    log.info('Reading %d of %d entries.', len(todo), len(refs))
+    states = {}  # Taken before the workbooks are read.
+    if todo and jobs != 1 and jobs is not None:
+        plan = plan_references(todo)
+        states.update((k, file_state(k)) for k in plan)
+        _preload(plan, Ref, cache, store, jobs, processes)
+    manifest = Manifest(old.fpath)
+
+    def _entries():
+        it = iter_references(todo, store, cache)
+        for i, (r, d) in enumerate(refs):
+            if reused[i]:
+                manifest.record(old.entries[i]['key'], old.entries[i]['files'],
+                                old.files)
+                yield previous[i]
+                continue
+            with track_dependencies() as deps:
+                value = next(it)
+            for k, v in deps.items():  # Cached workbooks were read before.
+                states.setdefault(k, v)
+            manifest.record(entry_key(r, d), deps, states)
+            yield value
+
+    if stream:  # Timed while it is consumed.
+        return timed_iter('process.read_references', _entries()), manifest
+    return list(_entries()), manifest
+
+
+@_node(outputs=['manifest_fpath'])
+@timed('process.save_manifest')
+def save_manifest(written, manifest):
+    """
+    Save the manifest of the incremental reading next to the output.
+
+    :param written:
+        File path where output are written.
+    :type written: str
+
+    :param manifest:
+        Manifest of the output entries.
+    :type manifest: xlref.manifest.Manifest
+
+    :return:
+        Manifest file path.
+    :rtype: str
+    """
+    return manifest.dump()
+
+
+def run(output_fpath, input_references=(), input_fpaths=(), **kwargs):
+    """
+    Read the data excel references and save the output, like the `dsp` but
+    without building it.
+
+    :param output_fpath:
+        Output file path.
+    :type output_fpath: str
+
+    :param input_references:
+        Data excel references from user.
+    :type input_references: tuple
+
+    :param input_fpaths:
+        File paths of the json data excel references.
+    :type input_fpaths: list[str]
+
+    :param kwargs:
+        Other inputs of the process model (see `DEFAULTS`).
+    :type kwargs: dict
+
+    :return:
+        File path where output are written.
+    :rtype: str
+    """
+    kw = {k: kwargs.get(k, v) for k, v in DEFAULTS.items() if k not in (
+        'input_references', 'input_fpaths', 'incremental'
+    )}
+    references = merge_references(input_references, load_json(input_fpaths))
+    if kwargs.get('incremental'):
+        data, manifest = read_incremental(
+            references, output_fpath, True, **kw
+        )
+        written = write_output(output_fpath, data)
+        save_manifest(written, manifest)
+    else:
+        written = write_output(output_fpath, read_references(references, **kw))
+    return written
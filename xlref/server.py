@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the reader server, which keeps the parsed workbooks warm between
+requests, and its client.
+
+The protocol is HTTP, over a Unix domain socket (when the address is a file
+path) or over TCP (when the address is `host:port`):
+
+- `POST /read` with a JSON body `{"references": [{"references": ...,
+  "curr_dir": ...}, ...], "format": "json"}` returns the output file content
+  in the requested format (see `xlref.process.WRITERS`),
+- `GET /stats` returns the cache statistics as JSON.
+"""
+import os
+import json
+import stat
+import socket
+import logging
+import weakref
+import tempfile
+import threading
+import collections
+import os.path as osp
+import http.client
+import http.server
+import socketserver
+
+log = logging.getLogger(__name__)
+
+
+def _is_unix(address):
+    if ':' in address and osp.sep not in address:
+        return False
+    if not hasattr(socket, 'AF_UNIX'):
+        raise OSError(
+            'Unix sockets are not supported on this platform, use an address '
+            'like `host:port` (got %r).' % address
+        )
+    return True
+
+
+def _tcp(address):
+    host, port = address.rsplit(':', 1)
+    return host or '127.0.0.1', int(port)
+
+
+def _state(fpath):
+    try:
+        st = os.stat(fpath)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = 'xlref'
+
+    def address_string(self):  # Unix sockets have no client address.
+        return self.client_address and self.client_address[0] or 'local'
+
+    def log_message(self, format, *args):
+        log.debug('%s - %s', self.address_string(), format % args)
+
+    def _send(self, code, body, ctype='application/json'):
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self._send(404, b'{"error": "Not found."}')
+        self._send(200, json.dumps(self.server.reader.cache.stats()).encode())
+
+    def do_POST(self):
+        if self.path != '/read':
+            return self._send(404, b'{"error": "Not found."}')
+        try:
+            n = int(self.headers.get('Content-Length', 0))
+            req = json.loads(self.rfile.read(n))
+            body = self.server.reader.read(
+                req['references'], req.get('format', 'json')
+            )
+        except Exception as ex:
+            log.debug('Failed request.', exc_info=True)
+            return self._send(400, json.dumps({'error': repr(ex)}).encode())
+        self._send(200, body, 'application/octet-stream')
+
+
+class Reader:
+    """
+    Reader of the reference batches with a warm cache of the workbooks.
+
+    The cached workbooks (and their sheets) are dropped when their file
+    modification time or size change.
+
+    :param max_bytes:
+        Memory budget of the cache in bytes (`None` means unbounded).
+    :type max_bytes: int
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+    """
+
+    def __init__(self, max_bytes=None, store=None):
+        from .cache import SheetCache
+        self.cache, self.store = SheetCache(max_bytes), store
+        self._states, self._lock = {}, threading.Lock()
+        # Requests using the workbooks, including the nested references.
+        self._using = collections.Counter()
+        # Locks are dropped when no request holds them.
+        self._locks = weakref.WeakValueDictionary()
+
+    def _file_lock(self, fpath):
+        with self._lock:
+            return self._locks.setdefault(fpath, threading.Lock())
+
+    def _record(self, states):
+        # States taken before reading the workbooks that are still cached.
+        with self._lock:
+            for fpath in [k for k in self.cache if isinstance(k, str)]:
+                if fpath not in self._states and fpath in states:
+                    self._states[fpath] = states[fpath]
+
+    def _use(self, fpath):
+        # Called before the workbook is taken from the cache.
+        with self._lock:
+            self._using[fpath] += 1
+        return _state(fpath)
+
+    def _release(self, fpaths):
+        with self._lock:
+            self._using.subtract(fpaths)
+            for fpath in fpaths:
+                if self._using[fpath] <= 0:
+                    del self._using[fpath]
+
+    def _drop(self, fpath):
+        state, cache = _state(fpath), self.cache
+        with self._lock:  # Books in use are neither dropped nor closed.
+            if self._using[fpath] or self._states.get(fpath, state) == state:
+                return
+            self._states.pop(fpath, None)
+            book = cache.pop(fpath, None)
+        log.info('Reloading %s.', fpath)
+        for k in list(cache):
+            if isinstance(k, tuple) and k[0] is book:
+                cache.pop(k, None)
+        if book is not None:
+            book.close()
+
+    def validate(self, held=()):
+        """
+        Drop (and close) the cached workbooks whose file has changed.
+
+        The workbooks being read by other requests (also through nested
+        references) are skipped.
+
+        :param held:
+            File paths whose locks are held by the caller.
+        :type held: collections.abc.Container[str]
+        """
+        for fpath in [k for k in self.cache if isinstance(k, str)]:
+            if fpath in held:
+                self._drop(fpath)
+                continue
+            lock = self._file_lock(fpath)
+            if lock.acquire(blocking=False):
+                try:
+                    self._drop(fpath)
+                finally:
+                    lock.release()
+
+    def read(self, references, fmt='json'):
+        """
+        Read a batch of references.
+
+        :param references:
+            References (`'references'`) with the directory of the relative
+            ones (`'curr_dir'`).
+        :type references: list[dict]
+
+        :param fmt:
+            Output format (e.g., `'json'` or `'npz'`).
+        :type fmt: str
+
+        :return:
+            Output file content.
+        :rtype: bytes
+        """
+        from .parser import track_dependencies
+        from .process import (
+            _FileRefs, read_references, write_output, plan_references, WRITERS
+        )
+        if fmt not in WRITERS:  # It is part of the output file path.
+            raise ValueError('Unknown output format %r.' % fmt)
+        # Relative references are resolved from the directory of `fpath`.
+        references = [_FileRefs(
+            r['references'], osp.join(r.get('curr_dir') or '.', '')
+        ) for r in references]
+        fpaths = sorted(plan_references(references))
+        locks = [self._file_lock(k) for k in fpaths]
+        for lock in locks:  # Sheets of the same workbook are read serially.
+            lock.acquire()
+        try:
+            self.validate(held=fpaths)
+            with track_dependencies(self._use) as states:
+                try:
+                    data = read_references(
+                        references, store=self.store, cache=self.cache
+                    )
+                finally:
+                    self._record(states)
+                    self._release(list(states))
+        finally:
+            for lock in locks:
+                lock.release()
+        with tempfile.TemporaryDirectory() as d:
+            fpath = write_output(osp.join(d, 'out.%s' % fmt), data)
+            with open(fpath, 'rb') as f:
+                return f.read()
+
+
+if hasattr(socket, 'AF_UNIX'):  # Not available on Windows.
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class _TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def make_server(address, max_bytes=None, store=None):
+    """
+    Create the reader server.
+
+    :param address:
+        Unix socket path or `host:port`.
+    :type address: str
+
+    :param max_bytes:
+        Memory budget of the cache in bytes (`None` means unbounded).
+    :type max_bytes: int
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :return:
+        Server (use `serve_forever` to start it).
+    :rtype: socketserver.BaseServer
+    """
+    if _is_unix(address):
+        try:
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise FileExistsError('%r is not a socket.' % address)
+            os.remove(address)  # Stale socket.
+        except FileNotFoundError:
+            pass
+        server = _UnixServer(address, _Handler)
+    else:
+        server = _TCPServer(_tcp(address), _Handler)
+    server.reader = Reader(max_bytes, store)
+    return server
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super(_UnixConnection, self).__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def request(address, method, path, body=None, timeout=None):
+    """
+    Send a request to the reader server.
+
+    :param address:
+        Unix socket path or `host:port`.
+    :type address: str
+
+    :param method:
+        HTTP method.
+    :type method: str
+
+    :param path:
+        Request path (`'/read'` or `'/stats'`).
+    :type path: str
+
+    :param body:
+        JSON request body.
+    :type body: dict
+
+    :param timeout:
+        Connection timeout in seconds.
+    :type timeout: float
+
+    :return:
+        Response content.
+    :rtype: bytes
+    """
+    if _is_unix(address):
+        conn = _UnixConnection(address, timeout)
+    else:
+        conn = http.client.HTTPConnection(*_tcp(address), timeout=timeout)
+    try:
+        data = None if body is None else json.dumps(body).encode()
+        conn.request(method, path, data, {'Content-Type': 'application/json'})
+        res = conn.getresponse()
+        content = res.read()
+    finally:
+        conn.close()
+    if res.status != 200:
+        raise RuntimeError(json.loads(content)['error'])
+    return content
+
+
+def read(address, output_fpath, input_references=(), input_fpaths=()):
+    """
+    Read the references with the reader server and save the output.
+
+    :param address:
+        Unix socket path or `host:port`.
+    :type address: str
+
+    :param output_fpath:
+        Output file path (its extension is the output format).
+    :type output_fpath: str
+
+    :param input_references:
+        Data excel references from user.
+    :type input_references: tuple
+
+    :param input_fpaths:
+        File paths of the json data excel references.
+    :type input_fpaths: list[str]
+
+    :return:
+        File path where output are written.
+    :rtype: str
+    """
+    refs = [{'references': r, 'curr_dir': os.getcwd()}
+            for r in input_references]
+    for fpath in input_fpaths:
+        with open(fpath) as f:
+            refs.append({'references': json.load(f),
+                         'curr_dir': osp.dirname(osp.abspath(fpath))})
+    from .process import WRITERS
+    fmt = osp.splitext(output_fpath.lower())[1][1:]
+    fmt = fmt if fmt in WRITERS else 'json'  # Like `write_output`.
+    content = request(address, 'POST', '/read', {
+        'references': refs, 'format': fmt
+    })
+    os.makedirs(osp.dirname(output_fpath) or '.', exist_ok=True)
+    with open(output_fpath, 'wb') as f:
+        f.write(content)
+    return output_fpath
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2020-2024 Vincenzo Arcidiacono;
+# Licensed under the EUPL (the 'Licence');
+# You may not use this work except in compliance with the Licence.
+# You may obtain a copy of the Licence at: http://ec.europa.eu/idabc/eupl
+"""
+It provides the process pool loader of the workbooks.
+
+The sheets parsed by the worker processes are handed off to the parent through
+memory-mapped files in shared memory (i.e., `/dev/shm` when available), so the
+typed blocks are mapped without copies and the object blocks are transferred
+as integer codes plus a compact table of their distinct values. Without shared
+memory (e.g., on Windows) the blocks are read from a temporary directory into
+memory, since open mapped files could not be removed.
+"""
+import os
+import uuid
+import shutil
+import logging
+import tempfile
+import numpy as np
+import os.path as osp
+from .engines import Book, Columns, LazySheet
+from .instrument import span
+
+log = logging.getLogger(__name__)
+
+
+def _shm_dir():
+    return '/dev/shm' if osp.isdir('/dev/shm') else None
+
+
+def _encode(block):
+    # Codes of the object block values (`-1` is empty) and table of values.
+    flat, index, table = block.ravel(), {}, []
+    codes = np.full(flat.shape, -1, np.int32)
+    for i, v in enumerate(flat.tolist()):
+        if v == v:  # Skip nan.
+            k = v.__class__, v
+            if k not in index:
+                index[k] = len(table)
+                table.append(v)
+            codes[i] = index[k]
+    return codes.reshape(block.shape), table
+
+
+def _decode(codes, table):
+    values = np.empty(len(table) + 1, object)
+    values[:-1], values[-1] = table, np.nan
+    return values[codes]
+
+
+def publish(columns, directory):
+    """
+    Write the blocks of typed columns into a shared memory directory.
+
+    :param columns:
+        Typed columns.
+    :type columns: xlref.engines.Columns
+
+    :param directory:
+        Shared memory directory.
+    :type directory: str
+
+    :return:
+        Descriptor of the published columns.
+    :rtype: dict
+    """
+    blocks = []
+    for c0, c1, block in columns.blocks:
+        fpath, table = osp.join(directory, '%s.npy' % uuid.uuid4().hex), None
+        if block.dtype == object:
+            block, table = _encode(np.asarray(block))
+        np.save(fpath, block)
+        blocks.append((c0, c1, fpath, table))
+    return {'shape': columns.shape, 'blocks': blocks, 'extra': columns.extra}
+
+
+def attach(desc, mmap=True):
+    """
+    Map the published blocks of typed columns.
+
+    :param desc:
+        Descriptor of the published columns.
+    :type desc: dict
+
+    :param mmap:
+        Map the blocks instead of reading them into memory.
+    :type mmap: bool
+
+    :return:
+        Typed columns.
+    :rtype: xlref.engines.Columns
+    """
+    blocks = []
+    for c0, c1, fpath, table in desc['blocks']:
+        block = np.load(fpath, mmap_mode='r' if mmap else None)
+        if table is not None:
+            block = _decode(block, table)
+        blocks.append((c0, c1, block))
+    return Columns(blocks, desc['shape'], desc['extra'])
+
+
+class ParsedBook(Book):
+    """Workbook engine with sheet names known from a worker process."""
+
+    def __init__(self, book, sheet_names):
+        super(ParsedBook, self).__init__(book.fpath, book.opener)
+        self.base, self._sheet_names = book, sheet_names
+
+    @property
+    def sheet_names(self):
+        return self._sheet_names
+
+    def iter_rows(self, name):
+        return self.base.iter_rows(name)
+
+    def parse(self, name):
+        return self.base.parse(name)
+
+    def sheet(self, name):
+        return self.base.sheet(name)
+
+    def shape(self, name):
+        return self.base.shape(name)
+
+    def close(self):
+        self.base.close()
+
+
+def _parse(pclass, fpath, sheets, store, directory):
+    p = pclass('%s#A1' % fpath, store=store)
+    wb = p.book
+    names = {sn or p._first_sheet() for sn in sheets}
+    names = sorted(sn for sn in names if sn in wb.sheet_indices)
+    return list(wb.sheet_names), {
+        sn: publish(s.columns, directory) for sn, s in
+        (wb.sheets(names) if names else {}).items()
+    }
+
+
+def load(plan, pclass, cache, store=None, jobs=None):
+    """
+    Load the planned sheets in a process pool into the cache.
+
+    :param plan:
+        Lower sheet names (`''` is the first sheet) by workbook file path.
+    :type plan: dict[str, list[str]]
+
+    :param pclass:
+        Reference parser class.
+    :type pclass: type
+
+    :param cache:
+        In-memory cache of the parsed workbooks and sheets.
+    :type cache: xlref.cache.SheetCache
+
+    :param store:
+        Persistent cache of the parsed sheets.
+    :type store: xlref.cache.DiskCache
+
+    :param jobs:
+        Number of processes (`None` uses all CPUs).
+    :type jobs: int
+
+    :return:
+        Number of loaded sheets.
+    :rtype: int
+    """
+    from multiprocessing import Pool
+    plan = {k: v for k, v in plan.items() if k not in cache}
+    if not plan:
+        return 0
+    shm, n = _shm_dir(), 0
+    directory = tempfile.mkdtemp(prefix='xlref-', dir=shm)
+    try:
+        with Pool(min(jobs or os.cpu_count() or 1, len(plan))) as pool:
+            res = [(fpath, pool.apply_async(_parse, (
+                pclass, fpath, sheets, store, directory
+            ))) for fpath, sheets in sorted(plan.items())]
+            for fpath, r in res:
+                # The workers do not report, hence their wait is timed.
+                with span('shared.load', file=fpath) as s:
+                    try:
+                        sheet_names, sheets = r.get()
+                    except Exception:  # Errors are raised by the refs.
+                        log.debug('Failed loading %s.', fpath, exc_info=True)
+                        continue
+                    wb = pclass('%s#A1' % fpath, store=store)
+                    wb = wb._open_workbook(fpath)
+                    cache[fpath] = wb = ParsedBook(wb, sheet_names)
+                    nbytes = 0
+                    for sn, desc in sheets.items():
+                        sheet = LazySheet(values=attach(desc, shm is not None))
+                        cache[(wb, sn)], nbytes = sheet, nbytes + sheet.nbytes
+                        n += 1
+                    s.update(nbytes=nbytes)
+    finally:  # Mapped files stay valid after unlinking.
+        try:
+            shutil.rmtree(directory)
+        except OSError:
+            log.warning('Failed removing %s.', directory, exc_info=True)
+    return n